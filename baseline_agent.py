@@ -9,7 +9,7 @@ from embedding import PartialEmbedding
 def act(emb: PartialEmbedding, randomness, rand):
     """Take a semi-greedy action"""
     min_ts_actions = None
-    possible_actions = sorted(emb.possibilities())
+    possible_actions = emb.possibilities()
 
     min_ts = inf
     for (u, v, t) in possible_actions:
@@ -48,7 +48,7 @@ def play_episode(embedding, max_restarts, rand):
     """Play an entire episode and report the reward"""
     restarts = 0
     while max_restarts is None or restarts < max_restarts:
-        if len(embedding.possibilities()) == 0:
+        if embedding.num_possibilities() == 0:
             if embedding.is_complete():
                 return embedding.used_timeslots
             restarts += 1
@@ -18,11 +18,7 @@ def draw_embedding(
 ):
     """Draws a given PartialEmbedding"""
     g = embedding.graph
-    shared_args = {
-        "G": g,
-        "node_size": 1000,
-        "pos": nx.shell_layout(embedding.graph),
-    }
+    shared_args = {"G": g, "node_size": 1000, "pos": nx.shell_layout(g)}
 
     node_list = g.nodes()
     chosen = [node for node in node_list if g.nodes[node]["chosen"]]
@@ -117,8 +113,8 @@ def succinct_representation(embed, distance_scale=3):
     scale_factor = distance_scale / embed.infra.min_node_distance()
     blocks_in_node = defaultdict(set)
 
-    for enode in embed.graph.nodes():
-        if embed.graph.node[enode]["chosen"] and enode.block is not None:
+    for enode in embed.nodes():
+        if embed.is_chosen(enode) and enode.block is not None:
             blocks_in_node[enode.node].add(enode.block)
 
     for infra_node in embed.infra.nodes():
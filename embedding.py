@@ -1,17 +1,34 @@
 """Model of wireless overlay networks"""
 
+# pylint: disable=too-many-lines
+
 from typing import List, Tuple, Iterable
 from collections import defaultdict
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+import copy
 import math
 
+import numpy as np
 import networkx as nx
 
+import wsignal
 from infrastructure import InfrastructureNetwork
 from overlay import OverlayNetwork
 
 DEBUG = False
 
 
+def _bool_array(flags: bytearray):
+    """Copies a bytearray of flags into a boolean array"""
+    if not flags:
+        return np.zeros(0, dtype=bool)
+    # copy first, since a bytearray can't be resized while a numpy
+    # array references its buffer
+    return np.frombuffer(bytes(flags), dtype=np.uint8).astype(bool)
+
+
 class ENode:
     """A node representing a possible or actual embedding"""
 
@@ -65,8 +82,44 @@ class ENode:
         return self._hash
 
 
+class ChangeLog:
+    """Everything that changed in a partial embedding since the log was
+    started, see `PartialEmbedding.track_changes`. Additions and
+    removals may cancel out, so the current state of everything that is
+    mentioned has to be looked up in the embedding."""
+
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+
+    def __init__(self):
+        # enode indices
+        self.enodes_added = set()
+        self.enodes_removed = set()
+        self.enodes_chosen = set()
+        # edge indices
+        self.edges_added = set()
+        self.edges_removed = set()
+        self.edges_chosen = set()
+        # (source idx, target idx) pairs of the open timeslot
+        self.open_edges_added = set()
+        self.open_edges_removed = set()
+        # infrastructure nodes whose remaining capacity changed
+        self.capacity_changed = set()
+        # timeslots in which the sending nodes changed
+        self.senders_changed = set()
+        # timeslots that were opened or closed again
+        self.timeslots_opened = set()
+        # blocks that were embedded or unembedded
+        self.blocks_embedded = set()
+        # infrastructure nodes that changed, which may affect everything
+        self.infrastructure_changed = set()
+
+    def record(self, kind: str, key):
+        """Records that something of a kind changed"""
+        getattr(self, kind).add(key)
+
+
 class PartialEmbedding:
-    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
     # Instance attributes needed for caching, I think private instance
     # attributes are fine.
     """A graph representing a partial embedding and possible actions"""
@@ -83,45 +136,631 @@ class PartialEmbedding:
         self.source_mapping = source_mapping
         self.used_timeslots = -1
 
-        self.graph = nx.MultiDiGraph()
+        # The possibilities graph is stored as integer-indexed tables
+        # instead of a networkx graph. ENodes are numbered in the order
+        # they are added, edges are numbered in the order they are
+        # created. Removed nodes and edges are only marked as dead,
+        # which keeps all indices stable.
+        self._enodes = []
+        self._enode_idx = dict()
+        self._enode_alive = bytearray()
+        self._enode_chosen = bytearray()
+        self._out_edges = []
+        self._in_edges = []
+        # rank of each enode in the deterministic ENode order, computed
+        # lazily
+        self._enode_rank = None
+
+        # struct of arrays, one entry per edge ever created
+        self._edge_source = array("l")
+        self._edge_target = array("l")
+        self._edge_timeslot = array("l")
+        self._edge_alive = bytearray()
+        self._edge_chosen = bytearray()
+        # (source idx, target idx, timeslot) -> edge idx for live edges
+        self._edge_idx = dict()
+        # timeslot -> live edges that are not chosen
+        self._unchosen_in = defaultdict(set)
+
+        # The newest timeslot is still empty and only represented
+        # implicitly. Its edges are kept as source idx -> target idxs
+        # (and the reverse) and only become real edges once something is
+        # scheduled in it. Without interference the same edges are
+        # feasible in every empty timeslot, so they carry over to the
+        # next open timeslot.
+        self._open_out = []
+        self._open_in = []
+        # number of those edges starting at a chosen enode, i.e. the
+        # possible actions in the open timeslot
+        self._open_possible = 0
+        # interference-free capacity of every pair of nodes, which is
+        # all that matters for feasibility in an empty timeslot and an
+        # upper bound for all the others
+        self._capacity_alone = infra.interference_free_capacity_matrix()
+        # timeslot -> for each node whether it sending would invalidate
+        # a chosen connection, computed on demand
+        self._breaking_senders = dict()
+
+        # Live index of the possible actions (unchosen edges starting at
+        # a chosen enode) as sorted (source rank, target rank, timeslot,
+        # source idx, target idx) keys, updated whenever the graph
+        # changes. Actions in the open timeslot are not included.
+        self._possible_order = []
+        # merged with the open timeslot and translated into ENodes on
+        # demand
+        self._possibilities = None
+
+        # the senders of each timeslot as bitmasks over the
+        # infrastructure node indices
+        self._sending_mask = dict()
+        self._init_indexes()
+
+        # Journal of (revert function, args) entries for every change,
+        # only recorded after the first checkpoint.
+        self._journal = None
+        # journal positions at which actions were started
+        self._action_tokens = []
+        # see `track_changes`
+        self._changes = None
 
+        self._build_possibilities_graph(source_mapping)
+        # keep up with moving or reconfigured infrastructure nodes
+        infra.subscribe(self)
+
+        # Building the initial state is expensive, so keep a copy of it
+        # around as a template for resets. It is shared by all resets
+        # and forks. Actions are never taken on it, only the
+        # infrastructure notifications update it (it is subscribed like
+        # every fork) so that resets follow the infrastructure.
+        self._template = None
+        template = self.fork()
+        # pylint: disable=protected-access
+        template._template = template
+        self._template = template
+
+    def _init_indexes(self):
+        """Sets up the empty lookup tables of the embedding state, only
+        called from `__init__`"""
+        # pylint: disable=attribute-defined-outside-init
         # just for ease of access
         self._by_block = defaultdict(set)
         self._by_node = defaultdict(set)
+        # relays by the link they are part of and by (node, block) for
+        # both blocks of that link
+        self._relays_by_link = defaultdict(set)
+        self._relays_by_node_block = defaultdict(set)
         self.taken_edges = dict()
         # per-timeslot, more scalable
         self.taken_edges_in = defaultdict(set)
         self._nodes_sending_in = defaultdict(set)
+        # timeslot -> total power (watts) received at each infrastructure
+        # node from everything sending in the timeslot
+        self._interference_at = dict()
+        # (timeslot, node) -> blocks whose data the node sends/receives
+        self._blocks_sent_by = defaultdict(set)
+        self._blocks_received_by = defaultdict(set)
         self.taken_embeddings = dict()
+        # requirements of the blocks that are not embedded yet, sorted
+        self._unembedded_requirements = sorted(
+            self.overlay.requirement(block)
+            for block in self.overlay.blocks()
+        )
         self._num_outlinks_embedded = defaultdict(int)
         self._capacity_used = defaultdict(float)
         self._transmissions_at = defaultdict(list)
         self.link_embeddings = dict()
         self.finished_embeddings = set()
-
-        self._build_possibilities_graph(source_mapping)
+        # see `enode_column`
+        self._enode_columns = dict()
 
     def reset(self):
         """Returns a fresh, identically configured partial embedding"""
-        return PartialEmbedding(self.infra, self.overlay, self.source_mapping)
+        return self._template.fork()
+
+    def fork(self):
+        """Returns an independent copy of the current state, e.g. for
+        lookahead. The infrastructure (including its SINR caches) and
+        the overlay are shared, only the embedding state is copied."""
+        # pylint: disable=protected-access
+        clone = copy.copy(self)
+
+        # flat tables are copied with a single memcpy
+        clone._enodes = list(self._enodes)
+        clone._enode_idx = dict(self._enode_idx)
+        clone._enode_alive = bytearray(self._enode_alive)
+        clone._enode_chosen = bytearray(self._enode_chosen)
+        clone._edge_source = array("l", self._edge_source)
+        clone._edge_target = array("l", self._edge_target)
+        clone._edge_timeslot = array("l", self._edge_timeslot)
+        clone._edge_alive = bytearray(self._edge_alive)
+        clone._edge_chosen = bytearray(self._edge_chosen)
+        clone._edge_idx = dict(self._edge_idx)
+        clone._possible_order = list(self._possible_order)
+        # the vectors themselves are replaced, never modified
+        clone._breaking_senders = dict(self._breaking_senders)
+        # the rank table and the possibilities cache are replaced, never
+        # modified, so they can be shared
+
+        clone._out_edges = [edges.copy() for edges in self._out_edges]
+        clone._in_edges = [edges.copy() for edges in self._in_edges]
+        clone._open_out = [targets.copy() for targets in self._open_out]
+        clone._open_in = [sources.copy() for sources in self._open_in]
+        clone.taken_edges = dict(self.taken_edges)
+        clone._sending_mask = dict(self._sending_mask)
+        # the vectors are replaced, never modified
+        clone._interference_at = dict(self._interference_at)
+        clone.taken_embeddings = dict(self.taken_embeddings)
+        clone._unembedded_requirements = list(self._unembedded_requirements)
+        # the columns are replaced, never modified
+        clone._enode_columns = dict(self._enode_columns)
+        clone.finished_embeddings = set(self.finished_embeddings)
+        clone.link_embeddings = {
+            link: list(path) for (link, path) in self.link_embeddings.items()
+        }
+        clone._num_outlinks_embedded = copy.copy(self._num_outlinks_embedded)
+        clone._capacity_used = copy.copy(self._capacity_used)
+        for attr in [
+            "_by_block",
+            "_by_node",
+            "_relays_by_link",
+            "_relays_by_node_block",
+            "taken_edges_in",
+            "_nodes_sending_in",
+            "_blocks_sent_by",
+            "_blocks_received_by",
+            "_transmissions_at",
+            "_unchosen_in",
+        ]:
+            # defaultdicts of sets or lists
+            original = getattr(self, attr)
+            copied = copy.copy(original)
+            for (key, value) in original.items():
+                copied[key] = value.copy()
+            setattr(clone, attr, copied)
+
+        # a fork cannot be rolled back to before it was created
+        clone._journal = None
+        clone._action_tokens = []
+        # and does not report its changes unless asked to
+        clone._changes = None
+        self.infra.subscribe(clone)
+        return clone
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.infra.subscribe(self)
+
+    def checkpoint(self):
+        """Starts recording changes (if not already done) and returns a
+        token that can later be passed to `rollback`."""
+        if self._journal is None:
+            self._journal = []
+        return len(self._journal)
+
+    def rollback(self, token: int):
+        """Reverts all changes made since `checkpoint` returned the given
+        token, in reverse order."""
+        journal = self._journal
+        assert journal is not None and token <= len(journal)
+        # reverting should not be recorded itself
+        self._journal = None
+        while len(journal) > token:
+            (revert, args) = journal.pop()
+            revert(*args)
+        self._journal = journal
+        while self._action_tokens and self._action_tokens[-1] >= token:
+            self._action_tokens.pop()
+        # the open timeslot may have moved
+        self._possibilities = None
+
+    def undo(self):
+        """Reverts the last action taken since the first checkpoint.
+        Returns False if there is no such action."""
+        if not self._action_tokens:
+            return False
+        self.rollback(self._action_tokens[-1])
+        return True
+
+    def _log(self, revert, *args):
+        """Records how to revert a change, if changes are recorded"""
+        if self._journal is not None:
+            self._journal.append((revert, args))
+
+    def track_changes(self):
+        """Starts (or restarts) recording a `ChangeLog` of everything
+        that changes, including rollbacks"""
+        self._changes = ChangeLog()
+
+    def pop_changes(self):
+        """Returns the changes recorded since tracking was started or
+        this was last called (or None if they are not tracked) and
+        starts a new log"""
+        changes = self._changes
+        if changes is not None:
+            self._changes = ChangeLog()
+        return changes
+
+    def _record(self, kind: str, key=None):
+        if self._changes is not None:
+            self._changes.record(kind, key)
+
+    def _note(self, kind: str, key=None):
+        """Records a change that is not made through the table
+        primitives. It is recorded again when it is rolled back."""
+        self._log(self._record, kind, key)
+        self._record(kind, key)
+
+    def _set_add(self, container: set, item):
+        if item not in container:
+            self._log(container.discard, item)
+            container.add(item)
+
+    def _set_remove(self, container: set, item):
+        self._log(container.add, item)
+        container.remove(item)
+
+    def _list_append(self, container: list, item):
+        self._log(container.pop)
+        container.append(item)
+
+    def _sorted_remove(self, container: list, item):
+        pos = bisect_left(container, item)
+        assert container[pos] == item
+        self._log(insort, container, item)
+        del container[pos]
+
+    def _dict_set(self, container: dict, key, value):
+        if key in container:
+            self._log(container.__setitem__, key, container[key])
+        else:
+            self._log(container.__delitem__, key)
+        container[key] = value
 
     def possibilities(self):
         """Returns a list of possible actions (edges)"""
-        is_chosen = lambda node: self.graph.nodes[node]["chosen"]
-        chosen_nodes = [node for node in self.nodes() if is_chosen(node)]
-        out_edges = self.graph.out_edges(nbunch=chosen_nodes, data=True)
-        possibilities = [
-            (source, target, data["timeslot"])
-            for (source, target, data) in out_edges
-            if not data["chosen"]
-        ]
-        # make sure the order is deterministic
-        possibilities.sort(key=lambda pos: (pos[0], pos[1], pos[2]))
-        return possibilities
+        return list(self._possible_actions())
+
+    def num_possibilities(self):
+        """Returns the number of possible actions"""
+        return len(self._possible_order) + self._open_possible
+
+    def _possible_actions(self):
+        if self._possibilities is None:
+            rank = self._ranks()
+            timeslot = self.used_timeslots
+            open_keys = sorted(
+                (
+                    rank[source_idx],
+                    rank[target_idx],
+                    timeslot,
+                    source_idx,
+                    target_idx,
+                )
+                for (source_idx, chosen) in enumerate(self._enode_chosen)
+                if chosen
+                for target_idx in self._open_out[source_idx]
+            )
+            # the order of both indices is deterministic
+            self._possibilities = [
+                (self._enodes[source_idx], self._enodes[target_idx], ts)
+                for (_, _, ts, source_idx, target_idx) in merge(
+                    self._possible_order, open_keys
+                )
+            ]
+        return self._possibilities
+
+    def has_possibility(self, source: ENode, target: ENode, timeslot: int):
+        """Whether or not an action is contained in the possibilities"""
+        source_idx = self._enode_idx.get(source)
+        target_idx = self._enode_idx.get(target)
+        if source_idx is None or target_idx is None:
+            return False
+        if not self._enode_chosen[source_idx]:
+            return False
+        if timeslot == self.used_timeslots:
+            return target_idx in self._open_out[source_idx]
+        edge = self._edge_idx.get((source_idx, target_idx, timeslot))
+        return edge is not None and not self._edge_chosen[edge]
+
+    def _possible_key(self, edge: int):
+        rank = self._ranks()
+        source_idx = self._edge_source[edge]
+        target_idx = self._edge_target[edge]
+        return (
+            rank[source_idx],
+            rank[target_idx],
+            self._edge_timeslot[edge],
+            source_idx,
+            target_idx,
+        )
+
+    def _mark_possible(self, edge: int):
+        insort(self._possible_order, self._possible_key(edge))
+        self._possibilities = None
+
+    def _unmark_possible(self, edge: int):
+        key = self._possible_key(edge)
+        pos = bisect_left(self._possible_order, key)
+        assert self._possible_order[pos] == key
+        del self._possible_order[pos]
+        self._possibilities = None
+
+    def _invalidate_ranks(self):
+        """Has to be called whenever an ENode is added, since that
+        shifts the ranks of all other ENodes"""
+        self._enode_rank = None
+        if self._possible_order:
+            rank = self._ranks()
+            self._possible_order = sorted(
+                (
+                    rank[source_idx],
+                    rank[target_idx],
+                    ts,
+                    source_idx,
+                    target_idx,
+                )
+                for (_, _, ts, source_idx, target_idx) in self._possible_order
+            )
+        self._possibilities = None
+
+    def _ranks(self):
+        """Position of each enode index in the deterministic ENode order"""
+        if self._enode_rank is None:
+            order = sorted(
+                range(len(self._enodes)), key=lambda idx: self._enodes[idx]
+            )
+            self._enode_rank = [0] * len(order)
+            for (rank, idx) in enumerate(order):
+                self._enode_rank[idx] = rank
+        return self._enode_rank
+
+    def _edge_tuple(self, edge: int):
+        """Translates an edge index to a (source, target, timeslot)
+        triple"""
+        return (
+            self._enodes[self._edge_source[edge]],
+            self._enodes[self._edge_target[edge]],
+            self._edge_timeslot[edge],
+        )
 
     def nodes(self):
         """Shortcut to get all ENodes of the underlying graph"""
-        return self.graph.nodes()
+        return [
+            enode
+            for (enode, alive) in zip(self._enodes, self._enode_alive)
+            if alive
+        ]
+
+    def edges(self):
+        """Returns all (source, target, timeslot) edges of the graph"""
+        edges = [
+            self._edge_tuple(edge)
+            for (edge, alive) in enumerate(self._edge_alive)
+            if alive
+        ]
+        timeslot = self.used_timeslots
+        for (source_idx, target_idx) in self._open_edges():
+            edges.append(
+                (self._enodes[source_idx], self._enodes[target_idx], timeslot)
+            )
+        return edges
+
+    def enode_table(self):
+        """All ENodes ever added, by index. Removed ENodes are included,
+        see `enode_indices` for the live ones."""
+        return list(self._enodes)
+
+    def enode_indices(self):
+        """Indices of the live ENodes, in the order of `nodes`"""
+        return np.flatnonzero(_bool_array(self._enode_alive))
+
+    def enode_chosen_array(self):
+        """Whether or not the ENode with a given index is chosen"""
+        return _bool_array(self._enode_chosen)
+
+    def enode_column(self, name: str, fun, dtype=None):
+        """An array of `fun(enode)` for every ENode ever added, by index,
+        for values that only depend on the ENode and the infrastructure
+        (like its position). The column is kept under its name and only
+        extended for ENodes added since, until the infrastructure
+        changes."""
+        column = self._enode_columns.get(name)
+        done = 0 if column is None else len(column)
+        if column is None or done < len(self._enodes):
+            new = np.array(
+                [fun(enode) for enode in self._enodes[done:]], dtype=dtype
+            )
+            column = new if done == 0 else np.concatenate([column, new])
+            self._enode_columns[name] = column
+        return column
+
+    def unembedded_requirements(self):
+        """The requirements of the blocks that are not embedded yet, in
+        ascending order. Must not be modified."""
+        return self._unembedded_requirements
+
+    def num_unembedded_below(self, bound):
+        """The number of blocks that are not embedded yet and require
+        less than `bound`"""
+        return bisect_left(self._unembedded_requirements, bound)
+
+    def edge_arrays(self):
+        """Returns the edges as (source idx, target idx, timeslot)
+        arrays, in the order of `edges`"""
+        (sources, targets, timeslots) = self.edge_endpoints(
+            self.live_edge_indices()
+        )
+        (open_sources, open_targets) = self.open_edge_arrays()
+        return (
+            np.concatenate([sources, open_sources]),
+            np.concatenate([targets, open_targets]),
+            np.concatenate(
+                [
+                    timeslots,
+                    np.full(len(open_sources), self.used_timeslots, dtype=int),
+                ]
+            ),
+        )
+
+    def live_edge_indices(self):
+        """Indices of the live edges outside of the open timeslot"""
+        return np.flatnonzero(_bool_array(self._edge_alive))
+
+    def edge_endpoints(self, edges):
+        """Returns (source idx, target idx, timeslot) arrays for an array
+        of edge indices"""
+        return (
+            np.array(self._edge_source, dtype=int)[edges],
+            np.array(self._edge_target, dtype=int)[edges],
+            np.array(self._edge_timeslot, dtype=int)[edges],
+        )
+
+    def edge_chosen_array(self):
+        """Whether or not the edge with a given index is chosen"""
+        return _bool_array(self._edge_chosen)
+
+    def open_edge_arrays(self):
+        """Returns the edges of the open timeslot as (source idx, target
+        idx) arrays"""
+        open_edges = self._open_edges()
+        if not open_edges:
+            return (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+        (sources, targets) = zip(*open_edges)
+        return (np.array(sources, dtype=int), np.array(targets, dtype=int))
+
+    def is_open_edge(self, source_idx: int, target_idx: int):
+        """Whether or not two ENodes (by index) are connected in the open
+        timeslot"""
+        if source_idx >= len(self._open_out):
+            return False
+        return target_idx in self._open_out[source_idx]
+
+    def is_edge_chosen_array(self, sources, targets, timeslots):
+        """Like `is_edge_chosen`, for arrays of (source idx, target idx,
+        timeslot) edges"""
+        chosen = _bool_array(self._edge_alive) & _bool_array(
+            self._edge_chosen
+        )
+        width = len(self._enodes)
+
+        def keys(edge_sources, edge_targets, edge_timeslots):
+            edge_timeslots = np.asarray(edge_timeslots, dtype=np.int64)
+            return (edge_timeslots * width + edge_sources) * width + (
+                edge_targets
+            )
+
+        chosen_keys = keys(
+            np.array(self._edge_source, dtype=np.int64)[chosen],
+            np.array(self._edge_target, dtype=np.int64)[chosen],
+            np.array(self._edge_timeslot, dtype=np.int64)[chosen],
+        )
+        return np.isin(
+            keys(
+                np.asarray(sources, dtype=np.int64),
+                np.asarray(targets, dtype=np.int64),
+                timeslots,
+            ),
+            chosen_keys,
+        )
+
+    def _open_edges(self):
+        """(source idx, target idx) pairs of the open timeslot in a
+        deterministic order"""
+        return [
+            (source_idx, target_idx)
+            for (source_idx, targets) in enumerate(self._open_out)
+            for target_idx in sorted(targets)
+        ]
+
+    def has_node(self, enode: ENode):
+        """Whether or not an ENode is part of the graph"""
+        idx = self._enode_idx.get(enode)
+        return idx is not None and bool(self._enode_alive[idx])
+
+    def has_edge(self, source: ENode, target: ENode, timeslot: int):
+        """Whether or not a connection is part of the graph"""
+        if timeslot == self.used_timeslots:
+            return self._find_open(source, target) is not None
+        return self._find_edge(source, target, timeslot) is not None
+
+    def is_chosen(self, enode: ENode):
+        """Whether or not an ENode is chosen. The ENode has to exist."""
+        idx = self._enode_idx[enode]
+        assert self._enode_alive[idx]
+        return bool(self._enode_chosen[idx])
+
+    def is_edge_chosen(self, source: ENode, target: ENode, timeslot: int):
+        """Whether or not a connection is chosen. The connection has to
+        exist."""
+        if timeslot == self.used_timeslots:
+            # nothing is chosen in the open timeslot
+            assert self._find_open(source, target) is not None
+            return False
+        edge = self._find_edge(source, target, timeslot)
+        assert edge is not None
+        return bool(self._edge_chosen[edge])
+
+    def _find_edge(self, source: ENode, target: ENode, timeslot: int):
+        source_idx = self._enode_idx.get(source)
+        target_idx = self._enode_idx.get(target)
+        if source_idx is None or target_idx is None:
+            return None
+        return self._edge_idx.get((source_idx, target_idx, timeslot))
+
+    def _find_open(self, source: ENode, target: ENode):
+        """Returns the (source idx, target idx) pair of a connection in
+        the open timeslot, if it exists"""
+        source_idx = self._enode_idx.get(source)
+        target_idx = self._enode_idx.get(target)
+        if source_idx is None or target_idx is None:
+            return None
+        if target_idx not in self._open_out[source_idx]:
+            return None
+        return (source_idx, target_idx)
+
+    def _kind(self, enode: ENode):
+        if enode.block in self.overlay.sources:
+            return "source"
+        if enode.block == self.overlay.sink:
+            return "sink"
+        return "intermediate"
+
+    @property
+    def graph(self):
+        """The possibilities graph as a networkx MultiDiGraph.
+
+        This is built from scratch on every access and is only intended
+        for drawing and debugging.
+        """
+        graph = nx.MultiDiGraph()
+        for enode in self.nodes():
+            graph.add_node(
+                enode,
+                chosen=self.is_chosen(enode),
+                relay=enode.relay,
+                kind=self._kind(enode),
+            )
+        for (edge, alive) in enumerate(self._edge_alive):
+            if not alive:
+                continue
+            (source, target, timeslot) = self._edge_tuple(edge)
+            graph.add_edge(
+                source,
+                target,
+                chosen=bool(self._edge_chosen[edge]),
+                timeslot=timeslot,
+                key=timeslot,
+            )
+        timeslot = self.used_timeslots
+        for (source_idx, target_idx) in self._open_edges():
+            graph.add_edge(
+                self._enodes[source_idx],
+                self._enodes[target_idx],
+                chosen=False,
+                timeslot=timeslot,
+                key=timeslot,
+            )
+        return graph
 
     def remaining_capacity(self, node):
         """Returns the capacity remaining in a node"""
@@ -158,16 +797,16 @@ class PartialEmbedding:
         if not self._node_can_carry(enode.node, enode.block):
             return False
 
-        self._by_node[enode.node].add(enode)
-        self._by_block[enode.acting_as].add(enode)
-
-        kind = "intermediate"
-        if enode.block in self.overlay.sources:
-            kind = "source"
-        elif enode.block == self.overlay.sink:
-            kind = "sink"
+        self._set_add(self._by_node[enode.node], enode)
+        self._set_add(self._by_block[enode.acting_as], enode)
+        if enode.relay:
+            self._index_relay(enode)
 
-        self.graph.add_node(enode, chosen=False, relay=enode.relay, kind=kind)
+        idx = self._enode_idx.get(enode)
+        if idx is None:
+            self._append_enode(enode)
+        elif not self._enode_alive[idx]:
+            self._revive_enode(idx)
 
         # add the necessary edges
         for ts in range(self.used_timeslots + 1):
@@ -185,69 +824,93 @@ class PartialEmbedding:
         when the enode is the source, the sink or has an incoming chosen
         edge."""
         # pylint: disable=too-many-branches
-        if self.graph.node[enode]["chosen"]:
+        idx = self._enode_idx[enode]
+        if self._enode_chosen[idx]:
             return
 
-        self.graph.node[enode]["chosen"] = True
+        self._choose_enode(idx)
         requirement = self.overlay.requirement(enode.block)
         assert requirement <= self.infra.capacity(enode.node)
-        self._capacity_used[enode.node] += requirement
+        used = self._capacity_used[enode.node] + requirement
+        self._dict_set(self._capacity_used, enode.node, used)
+        self._note("capacity_changed", enode.node)
         for other in list(self._by_node[enode.node]):
-            if self.graph.node[other]["chosen"]:
+            if self.is_chosen(other):
                 continue
             if not self._node_can_carry(other.node, other.block):
                 self.remove_enode(other)
 
         if not enode.relay:
-            self.taken_embeddings[enode.block] = enode
+            self._dict_set(self.taken_embeddings, enode.block, enode)
+            self._sorted_remove(self._unembedded_requirements, requirement)
+            self._note("blocks_embedded", enode.block)
 
             # remove other options for embedding this block
             for option in list(self._by_block[enode.block]):
                 if option != enode and not option.relay:
                     self.remove_enode(option)
 
-            # remove unnecessary relays going over the same node
-            for block in self.overlay.blocks():
-                for option in [
-                    # relay nodes to and from this block on the same node
-                    ENode(block, enode.node, enode.acting_as),
-                    ENode(enode.acting_as, enode.node, block),
-                ]:
-                    if self.graph.has_node(option):
-                        self.remove_enode(option)
+            # remove unnecessary relays to and from this block going
+            # over the same node
+            key = (enode.node, enode.acting_as)
+            for option in list(self._relays_by_node_block.get(key, ())):
+                self.remove_enode(option)
         if enode.relay:
             # remove unnecessary placements going over the same node
             for option in [
                 ENode(enode.acting_as, enode.node),
                 ENode(enode.target, enode.node),
             ]:
-                if self.graph.has_node(option):
+                if self.has_node(option):
                     self.remove_enode(option)
 
     def try_add_edge(self, source: ENode, target: ENode, timeslot: int):
         """Tries to a possible connection to the graph if it is
         feasible."""
-        # networkx will silently create nodes, which can just as
-        # silently introduce bugs
-        assert self.graph.has_node(source)
-        assert self.graph.has_node(target)
+        assert self.has_node(source)
+        assert self.has_node(target)
 
         # this kind of edge can never be feasible, therefore trying to
         # add it would be a bug
         assert not target.relay or target.acting_as == source.acting_as
         assert not source.relay or source.target == target.target
 
-        self.graph.add_edge(
-            source,
-            target,
-            chosen=False,
-            timeslot=timeslot,
-            # edges are uniquely identified by (source, target, timeslot)
-            key=timeslot,
-        )
+        # Links that are too weak even without interference can never be
+        # feasible and therefore were never added either.
+        if not self._feasible_when_empty(source, target):
+            return False
+
+        if timeslot == self.used_timeslots:
+            return self._try_add_open(source, target)
+
         if not self._connection_feasible(source, target, timeslot):
-            self.remove_connection(source, target, timeslot)
+            if self.has_edge(source, target, timeslot):
+                self.remove_connection(source, target, timeslot)
             return False
+
+        source_idx = self._enode_idx[source]
+        target_idx = self._enode_idx[target]
+        # edges are uniquely identified by (source, target, timeslot)
+        key = (source_idx, target_idx, timeslot)
+        if key in self._edge_idx:
+            return True
+
+        self._append_edge(source_idx, target_idx, timeslot)
+        return True
+
+    def _try_add_open(self, source: ENode, target: ENode):
+        """try_add_edge for the open timeslot. Since it is empty, only
+        necessity is left to check once the link is known to be strong
+        enough on its own."""
+        source_idx = self._enode_idx[source]
+        target_idx = self._enode_idx[target]
+        exists = target_idx in self._open_out[source_idx]
+        if not self._connection_necessary(source, target):
+            if exists:
+                self._open_unlink(source_idx, target_idx)
+            return False
+        if not exists:
+            self._open_link(source_idx, target_idx)
         return True
 
     def add_edge(self, source: ENode, target: ENode, timeslot: int):
@@ -260,40 +923,63 @@ class PartialEmbedding:
         of the graph with the consequences. Should only ever be done
         when the source node is already chosen."""
         # pylint: disable=too-many-branches,too-many-statements
-        assert self.graph.node[source]["chosen"]
-        self.graph.edges[(source, target, timeslot)]["chosen"] = True
+        assert self.is_chosen(source)
+        scheduled_in_open = timeslot == self.used_timeslots
+        if scheduled_in_open:
+            # The open timeslot becomes a real one and the next one is
+            # opened. Its other edges are only materialised once the
+            # consequences of this choice are known.
+            self._append_edge(
+                self._enode_idx[source], self._enode_idx[target], timeslot
+            )
+            self._open_next_timeslot()
+        self._choose_edge(self._find_edge(source, target, timeslot))
         if source.node != target.node:
-            self._nodes_sending_in[timeslot].add(source.node)
+            self._set_add(self._nodes_sending_in[timeslot], source.node)
+            self._note("senders_changed", timeslot)
+            self._start_sending(source.node, timeslot)
+            block = source.acting_as
+            sent_by = self._blocks_sent_by[(timeslot, source.node)]
+            self._set_add(sent_by, block)
+            received_by = self._blocks_received_by[(timeslot, target.node)]
+            self._set_add(received_by, block)
 
         link = (source.acting_as, target.target)
         # if this starts a link embedding
         if not source.relay:
-            self.link_embeddings[link] = [(source, None)]
-        self.link_embeddings[link].append((target, timeslot))
+            self._dict_set(self.link_embeddings, link, [(source, None)])
+        self._list_append(self.link_embeddings[link], (target, timeslot))
 
         # update other edges that may have represented this link
-        for (u, v, d) in list(
-            self.graph.out_edges(
-                nbunch=self._by_block[source.acting_as], data=True
-            )
-        ):
-            if not d["chosen"] and not self._connection_necessary(u, v):
-                self.remove_connection(u, v, d["timeslot"])
+        for enode in self._by_block[source.acting_as]:
+            for edge in list(self._out_edges[self._enode_idx[enode]]):
+                if self._edge_chosen[edge]:
+                    continue
+                (u, v, t) = self._edge_tuple(edge)
+                if not self._connection_necessary(u, v):
+                    self.remove_connection(u, v, t)
+            idx = self._enode_idx[enode]
+            for target_idx in list(self._open_out[idx]):
+                if not self._connection_necessary(
+                    enode, self._enodes[target_idx]
+                ):
+                    self._open_unlink(idx, target_idx)
 
         # if this finishes a link embedding
         if not target.relay:
-            self.finished_embeddings.add(link)
-            for node in self.infra.nodes():
-                relay = ENode(link[0], node, link[1])
-                data = self.graph.nodes.get(relay)
-                if data is not None and not data["chosen"]:
+            self._set_add(self.finished_embeddings, link)
+            for relay in list(self._relays_by_link.get(link, ())):
+                if not self.is_chosen(relay):
                     self.remove_enode(relay)
 
         if source.relay:
             self._remove_other_connections_from(source)
 
-        self._transmissions_at[timeslot].append((source, target))
-        self._remove_connections_infeasible_in(timeslot)
+        self._add_transmission(timeslot, source, target)
+        if scheduled_in_open:
+            self._materialize(timeslot)
+        else:
+            self._remove_connections_infeasible_in(timeslot)
 
     def _build_possibilities_graph(
         self, source_mapping: List[Tuple[str, str]]
@@ -303,34 +989,284 @@ class PartialEmbedding:
         self._embed_sink()
         self._embed_sources(source_mapping)
         self.add_timeslot()
+        # the edges of the first open timeslot are derived once, every
+        # following one inherits them
+        for enode in self.nodes():
+            self._add_outedges(enode, self.used_timeslots)
 
     def remove_connection(self, source: ENode, target: ENode, timeslot: int):
         """Removes a connection given its source, target and timeslot"""
-        assert not self.graph.edges[(source, target, timeslot)]["chosen"]
-        self.graph.remove_edge(source, target, timeslot)
+        if timeslot == self.used_timeslots:
+            self._open_unlink(*self._find_open(source, target))
+            return
+        edge = self._find_edge(source, target, timeslot)
+        assert not self._edge_chosen[edge]
+        self._remove_edge(edge)
+
+    def _index_relay(self, relay: ENode):
+        link = (relay.acting_as, relay.target)
+        self._set_add(self._relays_by_link[link], relay)
+        for block in link:
+            key = (relay.node, block)
+            self._set_add(self._relays_by_node_block[key], relay)
+
+    def _unindex_relay(self, relay: ENode):
+        link = (relay.acting_as, relay.target)
+        self._set_remove(self._relays_by_link[link], relay)
+        for block in link:
+            key = (relay.node, block)
+            self._set_remove(self._relays_by_node_block[key], relay)
 
     def remove_enode(self, enode: ENode):
         """Removes a node if it is not chosen"""
-        if self.graph.nodes[enode]["chosen"]:
+        idx = self._enode_idx[enode]
+        if self._enode_chosen[idx]:
             return False
-        self._by_block[enode.acting_as].remove(enode)
-        self._by_node[enode.node].remove(enode)
-        self.graph.remove_node(enode)
+        self._set_remove(self._by_block[enode.acting_as], enode)
+        self._set_remove(self._by_node[enode.node], enode)
+        if enode.relay:
+            self._unindex_relay(enode)
+        for edge in list(self._out_edges[idx]) + list(self._in_edges[idx]):
+            self._remove_edge(edge)
+        for target_idx in list(self._open_out[idx]):
+            self._open_unlink(idx, target_idx)
+        for source_idx in list(self._open_in[idx]):
+            self._open_unlink(source_idx, idx)
+        self._kill_enode(idx)
         return True
 
+    # The following primitives are the only functions that modify the
+    # enode and edge tables. Each of them records its inverse.
+
+    def _append_enode(self, enode: ENode):
+        self._log(self._pop_enode)
+        self._record("enodes_added", len(self._enodes))
+        self._enode_idx[enode] = len(self._enodes)
+        self._enodes.append(enode)
+        self._enode_alive.append(True)
+        self._enode_chosen.append(False)
+        self._out_edges.append(set())
+        self._in_edges.append(set())
+        self._open_out.append(set())
+        self._open_in.append(set())
+        self._invalidate_ranks()
+
+    def _pop_enode(self):
+        self._log(self._append_enode, self._enodes[-1])
+        self._record("enodes_removed", len(self._enodes) - 1)
+        del self._enode_idx[self._enodes.pop()]
+        self._enode_alive.pop()
+        self._enode_chosen.pop()
+        self._out_edges.pop()
+        self._in_edges.pop()
+        self._open_out.pop()
+        self._open_in.pop()
+        self._invalidate_ranks()
+        # the index may be reused by another ENode
+        for (name, column) in self._enode_columns.items():
+            self._enode_columns[name] = column[: len(self._enodes)]
+
+    def _revive_enode(self, idx: int):
+        self._log(self._kill_enode, idx)
+        self._record("enodes_added", idx)
+        self._enode_alive[idx] = True
+
+    def _kill_enode(self, idx: int):
+        self._log(self._revive_enode, idx)
+        self._record("enodes_removed", idx)
+        self._enode_alive[idx] = False
+
+    def _choose_enode(self, idx: int):
+        self._log(self._unchoose_enode, idx)
+        self._record("enodes_chosen", idx)
+        self._enode_chosen[idx] = True
+        for edge in self._out_edges[idx]:
+            if not self._edge_chosen[edge]:
+                self._mark_possible(edge)
+        self._open_possible += len(self._open_out[idx])
+        self._possibilities = None
+
+    def _unchoose_enode(self, idx: int):
+        self._log(self._choose_enode, idx)
+        self._record("enodes_chosen", idx)
+        for edge in self._out_edges[idx]:
+            if not self._edge_chosen[edge]:
+                self._unmark_possible(edge)
+        self._open_possible -= len(self._open_out[idx])
+        self._enode_chosen[idx] = False
+        self._possibilities = None
+
+    def _append_edge(self, source_idx: int, target_idx: int, timeslot: int):
+        self._log(self._pop_edge)
+        edge = len(self._edge_alive)
+        self._edge_source.append(source_idx)
+        self._edge_target.append(target_idx)
+        self._edge_timeslot.append(timeslot)
+        self._edge_alive.append(False)
+        self._edge_chosen.append(False)
+        self._link_edge(edge)
+
+    def _pop_edge(self):
+        edge = len(self._edge_alive) - 1
+        self._log(
+            self._append_edge,
+            self._edge_source[edge],
+            self._edge_target[edge],
+            self._edge_timeslot[edge],
+        )
+        self._unlink_edge(edge)
+        self._edge_source.pop()
+        self._edge_target.pop()
+        self._edge_timeslot.pop()
+        self._edge_alive.pop()
+        self._edge_chosen.pop()
+
+    def _remove_edge(self, edge: int):
+        self._log(self._link_edge, edge)
+        self._unlink_edge(edge)
+
+    def _link_edge(self, edge: int):
+        """Makes a dead edge alive again"""
+        source_idx = self._edge_source[edge]
+        target_idx = self._edge_target[edge]
+        timeslot = self._edge_timeslot[edge]
+        self._record("edges_added", edge)
+        self._edge_idx[(source_idx, target_idx, timeslot)] = edge
+        self._out_edges[source_idx].add(edge)
+        self._in_edges[target_idx].add(edge)
+        self._edge_alive[edge] = True
+        if not self._edge_chosen[edge]:
+            self._unchosen_in[timeslot].add(edge)
+            if self._enode_chosen[source_idx]:
+                self._mark_possible(edge)
+
+    def _unlink_edge(self, edge: int):
+        source_idx = self._edge_source[edge]
+        target_idx = self._edge_target[edge]
+        timeslot = self._edge_timeslot[edge]
+        self._record("edges_removed", edge)
+        del self._edge_idx[(source_idx, target_idx, timeslot)]
+        self._out_edges[source_idx].remove(edge)
+        self._in_edges[target_idx].remove(edge)
+        self._edge_alive[edge] = False
+        if not self._edge_chosen[edge]:
+            self._unchosen_in[timeslot].remove(edge)
+            if self._enode_chosen[source_idx]:
+                self._unmark_possible(edge)
+
+    def _open_link(self, source_idx: int, target_idx: int):
+        self._log(self._open_unlink, source_idx, target_idx)
+        self._record("open_edges_added", (source_idx, target_idx))
+        self._open_out[source_idx].add(target_idx)
+        self._open_in[target_idx].add(source_idx)
+        if self._enode_chosen[source_idx]:
+            self._open_possible += 1
+        self._possibilities = None
+
+    def _open_unlink(self, source_idx: int, target_idx: int):
+        self._log(self._open_link, source_idx, target_idx)
+        self._record("open_edges_removed", (source_idx, target_idx))
+        self._open_out[source_idx].remove(target_idx)
+        self._open_in[target_idx].remove(source_idx)
+        if self._enode_chosen[source_idx]:
+            self._open_possible -= 1
+        self._possibilities = None
+
+    def _open_next_timeslot(self):
+        self._log(setattr, self, "used_timeslots", self.used_timeslots)
+        self._note("timeslots_opened", self.used_timeslots + 1)
+        self.used_timeslots += 1
+        self._possibilities = None
+
+    def _choose_edge(self, edge: int):
+        self._log(self._unchoose_edge, edge)
+        self._record("edges_chosen", edge)
+        self._unmark_possible(edge)
+        self._unchosen_in[self._edge_timeslot[edge]].remove(edge)
+        self._edge_chosen[edge] = True
+
+    def _unchoose_edge(self, edge: int):
+        self._log(self._choose_edge, edge)
+        self._record("edges_chosen", edge)
+        self._edge_chosen[edge] = False
+        self._unchosen_in[self._edge_timeslot[edge]].add(edge)
+        self._mark_possible(edge)
+
+    def _add_transmission(self, timeslot: int, source: ENode, target: ENode):
+        self._log(self._remove_transmission, timeslot)
+        self._transmissions_at[timeslot].append((source, target))
+        self._breaking_senders.pop(timeslot, None)
+
+    def _remove_transmission(self, timeslot: int):
+        (source, target) = self._transmissions_at[timeslot].pop()
+        self._log(self._add_transmission, timeslot, source, target)
+        self._breaking_senders.pop(timeslot, None)
+
     def _invalidates_chosen(self, source, timeslot):
         """Checks if node sending would invalidate datarate of chosen action"""
-        for (u, v) in self._transmissions_at[timeslot]:
-            new_capacity = self.known_capacity(
-                u.node,
-                v.node,
-                timeslot=timeslot,
-                additional_senders={source.node},
+        if not self._transmissions_at.get(timeslot):
+            return False
+        breaking = self._breaking_senders.get(timeslot)
+        if breaking is None:
+            breaking = self._find_breaking_senders(timeslot)
+            self._breaking_senders[timeslot] = breaking
+        return bool(breaking[self.infra.node_index()[source.node]])
+
+    def _find_breaking_senders(self, timeslot):
+        """Determines for all nodes at once whether or not they would
+        push a chosen connection in a timeslot below its datarate by
+        starting to send"""
+        order = self.infra.node_index()
+        breaking = np.zeros(len(order), dtype=bool)
+        # loops are not affected by interference
+        links = [
+            (order[u.node], order[v.node], self.overlay.datarate(u.acting_as))
+            for (u, v) in self._transmissions_at[timeslot]
+            if u.node != v.node
+        ]
+        if not links:
+            return breaking
+        (src, dst, datarate) = map(np.array, zip(*links))
+        senders = np.unique(src)
+        gain = self.infra.interference_watt_matrix()
+
+        signal = self.infra.power_received_watt_matrix()[src, dst]
+        # every sender but the source interferes, infinite signals are
+        # never invalidated anyway
+        with np.errstate(invalid="ignore"):
+            interference = np.where(
+                np.isinf(signal),
+                0,
+                self._interference_at[timeslot][dst] - gain[src, dst],
             )
-            thresh = self.overlay.datarate(u.acting_as)
-            if new_capacity < thresh:
-                return True
-        return False
+        noise = wsignal.dbm_to_watt(self.infra.noise_floor_dbm)
+        # capacity >= datarate <=> signal / (noise + interference) >= ...
+        min_ratio = 2 ** (datarate / self.infra.bandwidth) - 1
+        with np.errstate(divide="ignore"):
+            headroom = signal / min_ratio - noise - interference
+
+        breaking = np.any(
+            (gain[:, dst] > headroom)
+            & (np.arange(len(order))[:, None] != src),
+            axis=1,
+        )
+        # senders that are already sending add no interference
+        breaking[senders] = False
+        return breaking
+
+    def _start_sending(self, node, timeslot):
+        """Accounts for the interference of a node sending in a
+        timeslot"""
+        node_idx = self.infra.node_index()[node]
+        mask = self._sending_mask.get(timeslot, 0)
+        if mask & (1 << node_idx):
+            return
+        self._dict_set(self._sending_mask, timeslot, mask | (1 << node_idx))
+        received = self.infra.interference_watt_matrix()[node_idx]
+        interference = self._interference_at.get(timeslot)
+        if interference is not None:
+            received = interference + received
+        self._dict_set(self._interference_at, timeslot, received)
 
     def _datarate_valid(self, source, target, timeslot):
         """Checks if connection datarate is valid"""
@@ -399,6 +1335,17 @@ class PartialEmbedding:
             return (True, reason)
         return (False, "")
 
+    def _feasible_when_empty(self, source, target):
+        """Whether or not a connection is feasible in a timeslot nothing
+        is scheduled in yet"""
+        if source.node == target.node:
+            return True
+        index = self.infra.node_index()
+        capacity = self._capacity_alone.item(
+            index[source.node], index[target.node]
+        )
+        return capacity >= self.overlay.datarate(source.acting_as)
+
     def _node_can_carry(self, node, block):
         """Weather or not a node can support the computation for a block
         in a given timeslot"""
@@ -411,22 +1358,14 @@ class PartialEmbedding:
         # the same embedding can send multiple times within a timeslot
         # (broadcasting results), but others cannot (which would send
         # other data)
-        result = set()
-        for (u, v) in self.taken_edges_in[timeslot]:
-            # loops within a node are okay
-            if u.node == node and not u.node == v.node:
-                result.add(u.acting_as)
-        return result
+        # loops within a node are okay and are not indexed
+        return self._blocks_sent_by.get((timeslot, node), frozenset())
 
     def _node_receiving(self, node, timeslot):
         """We work on the half-duplex assumption: sending and receiving
         is mutually exclusive."""
-        receiving = set()
-        for (u, v) in self.taken_edges_in[timeslot]:
-            # loops within a node are okay
-            if v.node == node and u.node != v.node:
-                receiving.add(u.acting_as)
-        return receiving
+        # loops within a node are okay and are not indexed
+        return self._blocks_received_by.get((timeslot, node), frozenset())
 
     def _connection_feasible_in_timeslot(self, source, target, timeslot):
         (infeasible, _reason) = self._why_infeasible_in_timeslot(
@@ -441,19 +1380,20 @@ class PartialEmbedding:
         if source.node == target.node:
             return (False, "")
 
+        if not self._feasible_when_empty(source, target):
+            return (True, "Link too weak even without interference")
+
         source_sending = self._node_sending(source.node, timeslot)
-        target_sending = self._node_sending(target.node, timeslot)
-        source_receiving = self._node_receiving(source.node, timeslot)
-        target_receiving = self._node_receiving(target.node, timeslot)
         if len(source_sending.difference((source.acting_as,))) > 0:
             return (True, "Source already sending other data in timeslot")
 
-        if len(target_sending) > 0:
+        if len(self._node_sending(target.node, timeslot)) > 0:
             return (True, "Target already sending data in timeslot")
 
-        if len(source_receiving) > 0:
+        if len(self._node_receiving(source.node, timeslot)) > 0:
             return (True, "Source already receiving data in timeslot")
 
+        target_receiving = self._node_receiving(target.node, timeslot)
         if len(target_receiving.difference((source.acting_as,))) > 0:
             return (True, "Target already receiving other data in timeslot")
 
@@ -467,33 +1407,29 @@ class PartialEmbedding:
 
     def _remove_other_connections_from(self, enode):
         """Removes not-chosen outedges for an enode"""
-        for (u, v, k, d) in list(
-            self.graph.out_edges(nbunch=[enode], keys=True, data=True)
-        ):
-            if not d["chosen"]:
-                self.remove_connection(u, v, k)
+        idx = self._enode_idx[enode]
+        for edge in list(self._out_edges[idx]):
+            if not self._edge_chosen[edge]:
+                self._remove_edge(edge)
+        for target_idx in list(self._open_out[idx]):
+            self._open_unlink(idx, target_idx)
 
     def _remove_connections_between(self, source, target):
         """Removes all remaining unchosen connections between two ENodes"""
         for timeslot in range(self.used_timeslots + 1):
-            if self.graph.has_edge(source, target, timeslot):
-                chosen = self.graph.edges[source, target, timeslot]["chosen"]
-                if not chosen:
+            if self.has_edge(source, target, timeslot):
+                if not self.is_edge_chosen(source, target, timeslot):
                     self.remove_connection(source, target, timeslot)
 
     def _remove_connections_infeasible_in(self, timeslot):
         """Removes connections that are no longer feasible within a
         timeslot"""
-        not_chosen_in_timeslot = [
-            (source, target)
-            for (source, target, data) in self.graph.out_edges(data=True)
-            if not data["chosen"] and data["timeslot"] == timeslot
-        ]
-        for (source, target) in not_chosen_in_timeslot:
+        for edge in list(self._unchosen_in.get(timeslot, ())):
+            (source, target, _) = self._edge_tuple(edge)
             if not self._connection_feasible_in_timeslot(
                 source, target, timeslot
             ):
-                self.remove_connection(source, target, timeslot)
+                self._remove_edge(edge)
 
     def known_capacity(
         self,
@@ -506,12 +1442,57 @@ class PartialEmbedding:
         Connection capacity assuming only already chosen edges and the
         currently considered edges are sending.
         """
-        sinr = self.known_sinr(
+        ratio = self._known_signal_ratio(
             source_node, target_node, timeslot, additional_senders
         )
-        bandwidth = self.infra.bandwidth
-        shannon_capacity = bandwidth * math.log(1 + 10 ** (sinr / 10), 2)
-        return shannon_capacity
+        return self.infra.bandwidth * math.log(1 + ratio, 2)
+
+    def known_capacity_array(self, source_nodes, target_nodes, timeslots):
+        """Like `known_capacity` (without additional senders), for arrays
+        of infrastructure node indices and timeslots"""
+        infra = self.infra
+        source_nodes = np.asarray(source_nodes, dtype=int)
+        target_nodes = np.asarray(target_nodes, dtype=int)
+        timeslots = np.asarray(timeslots, dtype=int)
+        signal = infra.power_received_watt_matrix()[source_nodes, target_nodes]
+        own = infra.interference_watt_matrix()[source_nodes, target_nodes]
+
+        interference = np.zeros(len(signal))
+        index = infra.node_index()
+        for (timeslot, received) in self._interference_at.items():
+            in_timeslot = timeslots == timeslot
+            if not in_timeslot.any():
+                continue
+            senders = [
+                index[node] for node in self._nodes_sending_in[timeslot]
+            ]
+            sending = np.zeros(len(index), dtype=bool)
+            sending[senders] = True
+            # always ignore the sending node (assuming broadcast, no
+            # self-interference)
+            interference[in_timeslot] = np.maximum(
+                received[target_nodes[in_timeslot]]
+                - np.where(
+                    sending[source_nodes[in_timeslot]], own[in_timeslot], 0.0
+                ),
+                0.0,
+            )
+
+        noise = wsignal.dbm_to_watt(infra.noise_floor_dbm)
+        with np.errstate(invalid="ignore"):
+            capacity = infra.bandwidth * np.log2(
+                1 + signal / (noise + interference)
+            )
+        # infinite signals need the exact treatment, see
+        # `_known_signal_ratio`
+        nodes = list(index)
+        for i in np.flatnonzero(np.isinf(signal)):
+            capacity[i] = self.known_capacity(
+                nodes[source_nodes[i]],
+                nodes[target_nodes[i]],
+                int(timeslots[i]),
+            )
+        return capacity
 
     def known_sinr(
         self,
@@ -522,14 +1503,67 @@ class PartialEmbedding:
     ):
         """SINR assuming only already chosen edges and the currently
         considered edges are sending"""
-        senders = self._nodes_sending_in[timeslot].union(additional_senders)
-        # always ignore the sending node in sinr calculations
-        # (assuming broadcast, no self-interference)
-        senders = frozenset(senders.difference({source_node}))
-        return self.infra.sinr(source_node, target_node, senders)
+        ratio = self._known_signal_ratio(
+            source_node, target_node, timeslot, additional_senders
+        )
+        if ratio <= 0:
+            return -math.inf
+        return 10 * math.log(ratio, 10)
+
+    def _known_signal_ratio(
+        self,
+        source_node: str,
+        target_node: str,
+        timeslot: int,
+        additional_senders: Iterable[str],
+    ):
+        """The SINR as a linear ratio, computed from the interference
+        accumulated in the timeslot"""
+        infra = self.infra
+        index = infra.node_index()
+        source_idx = index[source_node]
+        target_idx = index[target_node]
+        mask = self._sending_mask.get(timeslot, 0)
+        # plain floats are much faster to work with than numpy scalars
+        gain = infra.interference_watt_matrix().item
+        signal = infra.power_received_watt_matrix().item(
+            source_idx, target_idx
+        )
+        if math.isinf(signal):
+            # Nodes receive infinite power from themselves (and from
+            # nodes at the same position), which cannot be subtracted
+            # from the accumulated interference again.
+            if additional_senders:
+                mask |= infra.sender_mask(additional_senders)
+            mask &= ~(1 << source_idx)
+            sinr = infra.masked_sinr(source_node, target_node, mask)
+            return 10 ** (sinr / 10)
+
+        interference = 0.0
+        if mask:
+            interference = self._interference_at[timeslot].item(target_idx)
+            # always ignore the sending node in sinr calculations
+            # (assuming broadcast, no self-interference)
+            if mask & (1 << source_idx):
+                own = gain(source_idx, target_idx)
+                interference = max(interference - own, 0.0)
+        mask |= 1 << source_idx
+        for sender in additional_senders:
+            sender_idx = index[sender]
+            if not mask & (1 << sender_idx):
+                mask |= 1 << sender_idx
+                interference += gain(sender_idx, target_idx)
+
+        noise = wsignal.dbm_to_watt(infra.noise_floor_dbm)
+        return signal / (noise + interference)
 
     def _add_outedges(self, enode: ENode, timeslot: int):
         """Connect a new ENode to all its possible successors"""
+        for target in self._possible_successors(enode):
+            self.try_add_edge(enode, target, timeslot)
+
+    def _possible_successors(self, enode: ENode):
+        """ENodes that an ENode could possibly be connected to"""
         if enode.relay:
             outlinks = {(enode.acting_as, enode.target)}
         else:
@@ -538,20 +1572,143 @@ class PartialEmbedding:
                 self.overlay.graph.out_edges(nbunch=[enode.acting_as])
             ).difference(embedding_already_started)
 
-        for (_, v) in outlinks:
-            for node in self.infra.nodes():
-                relay_target = ENode(enode.acting_as, node, v)
-                if self.graph.nodes.get(relay_target) is not None:
-                    self.try_add_edge(enode, relay_target, timeslot)
+        successors = []
+        for (u, v) in outlinks:
+            successors.extend(self._relays_by_link.get((u, v), ()))
             for option in self._by_block[v]:
                 if not option.relay:
-                    self.try_add_edge(enode, option, timeslot)
+                    successors.append(option)
+        return successors
+
+    def infrastructure_changed(self, node):
+        """Re-checks the connections that may be affected by a node that
+        has moved or changed its transmit power: those from or to that
+        node and all connections in timeslots it is sending or receiving
+        in. Chosen connections are kept even if they are no longer
+        feasible, see `infeasible_chosen_connections`. Changes of the
+        infrastructure can not be rolled back."""
+        self._capacity_alone = self.infra.interference_free_capacity_matrix()
+        self._forget_history()
+        self._record("infrastructure_changed", node)
+        self._recompute_interference()
+        self._enode_columns.clear()
+
+        for timeslot in range(self.used_timeslots + 1):
+            everything = self._communicates_in(node, timeslot)
+
+            def affected(source, target):
+                # pylint: disable=cell-var-from-loop
+                return everything or node in (source.node, target.node)
+
+            if timeslot == self.used_timeslots:
+                for (source_idx, target_idx) in self._open_edges():
+                    source = self._enodes[source_idx]
+                    target = self._enodes[target_idx]
+                    if affected(source, target) and not (
+                        self._feasible_when_empty(source, target)
+                    ):
+                        self._open_unlink(source_idx, target_idx)
+            else:
+                for edge in list(self._unchosen_in.get(timeslot, ())):
+                    (source, target, _) = self._edge_tuple(edge)
+                    if affected(source, target) and not (
+                        self._connection_feasible_in_timeslot(
+                            source, target, timeslot
+                        )
+                    ):
+                        self._remove_edge(edge)
+
+            for source in self.nodes():
+                for target in self._possible_successors(source):
+                    if not affected(source, target):
+                        continue
+                    if self.has_edge(source, target, timeslot):
+                        if self.is_edge_chosen(source, target, timeslot):
+                            continue
+                    self.try_add_edge(source, target, timeslot)
+
+    def check_node_removable(self, node):
+        """Raises a ValueError if the embedding relies on a node"""
+        for enode in self._by_node.get(node, ()):
+            if self.is_chosen(enode):
+                raise ValueError(f"{enode} is already chosen")
+
+    def infrastructure_node_removed(self, node, index):
+        """Drops everything that could still be placed on a node that was
+        removed from the infrastructure"""
+        self._capacity_alone = self.infra.interference_free_capacity_matrix()
+        self._forget_history()
+        self._record("infrastructure_changed", node)
+        self._enode_columns.clear()
+        for enode in list(self._by_node.get(node, ())):
+            self.remove_enode(enode)
+        # the indices of all following nodes are shifted down by one
+        below = (1 << index) - 1
+        self._sending_mask = {
+            timeslot: (mask & below) | ((mask >> (index + 1)) << index)
+            for (timeslot, mask) in self._sending_mask.items()
+        }
+        self._recompute_interference()
+
+    def infeasible_chosen_connections(self):
+        """Chosen (source, target, timeslot) connections that do not
+        meet their datarate (anymore), which can only happen when the
+        infrastructure changed after they were chosen"""
+        infeasible = []
+        for (timeslot, transmissions) in sorted(
+            self._transmissions_at.items()
+        ):
+            for (source, target) in transmissions:
+                if source.node == target.node:
+                    continue
+                if not self._datarate_valid(source, target, timeslot):
+                    infeasible.append((source, target, timeslot))
+        return infeasible
+
+    def _communicates_in(self, node, timeslot):
+        """Whether or not a node sends or receives in a timeslot"""
+        return any(
+            node in (source.node, target.node)
+            for (source, target) in self._transmissions_at.get(timeslot, ())
+            if source.node != target.node
+        )
+
+    def _forget_history(self):
+        """Makes the current state the earliest one that can be rolled
+        back to"""
+        if self._journal is not None:
+            self._journal = []
+        self._action_tokens = []
+
+    def _recompute_interference(self):
+        """Recomputes the interference in all timeslots from the current
+        infrastructure"""
+        self._breaking_senders = dict()
+        index = self.infra.node_index()
+        gain = self.infra.interference_watt_matrix()
+        for timeslot in self._sending_mask:
+            senders = [
+                index[node] for node in self._nodes_sending_in[timeslot]
+            ]
+            self._interference_at[timeslot] = gain[senders].sum(axis=0)
+
+    def _materialize(self, timeslot: int):
+        """Turns the edges of the open timeslot that are feasible within
+        the given (formerly open) timeslot into real edges"""
+        for (source_idx, target_idx) in self._open_edges():
+            if (source_idx, target_idx, timeslot) in self._edge_idx:
+                continue
+            source = self._enodes[source_idx]
+            target = self._enodes[target_idx]
+            if self._connection_feasible_in_timeslot(source, target, timeslot):
+                self._append_edge(source_idx, target_idx, timeslot)
 
     def add_timeslot(self):
-        """Adds a new timeslot as an option"""
-        self.used_timeslots += 1
-        for enode in self.nodes():
-            self._add_outedges(enode, self.used_timeslots)
+        """Adds a new timeslot as an option. The edges of the previously
+        open timeslot become real, the new one inherits them."""
+        timeslot = self.used_timeslots
+        self._open_next_timeslot()
+        self._materialize(timeslot)
 
     def _check_invariants(self):
         """For debugging only, slow"""
@@ -577,7 +1734,8 @@ class PartialEmbedding:
         if not result:
             return (result, reason)
 
-        for (u, v, d) in self.graph.edges(data=True):
+        graph = self.graph
+        for (u, v, d) in graph.edges(data=True):
             t = d["timeslot"]
             chosen = d["chosen"]
             if not chosen and not self._connection_necessary(u, v):
@@ -590,8 +1748,8 @@ class PartialEmbedding:
                 return (False, f"({u}, {v}, {t}) does not represent any link")
 
         for enode in self.nodes():
-            if enode.relay and self.graph.nodes[enode]["chosen"]:
-                out_edges = self.graph.out_edges(nbunch=[enode], data=True)
+            if enode.relay and graph.nodes[enode]["chosen"]:
+                out_edges = graph.out_edges(nbunch=[enode], data=True)
                 has_chosen_out = False
                 for (u, v, d) in out_edges:
                     if d["chosen"]:
@@ -603,8 +1761,8 @@ class PartialEmbedding:
                         f"Relay {enode} has too many out edges: {out_edges}",
                     )
 
-        for (enode, deg) in self.graph.in_degree():
-            if enode.relay and self.graph.nodes[enode]["chosen"]:
+        for (enode, deg) in graph.in_degree():
+            if enode.relay and graph.nodes[enode]["chosen"]:
                 if deg != 1:
                     return (False, f"Chosen relay {enode} has indeg {deg}")
 
@@ -619,7 +1777,7 @@ class PartialEmbedding:
 
     def take_action(self, source: ENode, target: ENode, timeslot: int):
         """Take an action represented by an edge and update the graph"""
-        if (source, target, timeslot) not in self.possibilities():
+        if not self.has_possibility(source, target, timeslot):
             return False
 
         # this should never be false, that would be a bug
@@ -627,15 +1785,15 @@ class PartialEmbedding:
         assert self._connection_necessary(source, target)
         assert self._connection_feasible(source, target, timeslot)
 
-        self.taken_edges[(source, target)] = timeslot
-        self.taken_edges_in[timeslot].add((source, target))
+        if self._journal is not None:
+            self._action_tokens.append(len(self._journal))
+        self._dict_set(self.taken_edges, (source, target), timeslot)
+        self._set_add(self.taken_edges_in[timeslot], (source, target))
 
         self.choose_embedding(target)
+        # opens a new timeslot if necessary
         self.choose_edge(source, target, timeslot)
 
-        if timeslot >= self.used_timeslots:
-            self.add_timeslot()
-
         (result, reason) = self._check_invariants()
         if not result:
             raise Exception(
@@ -1,5 +1,5 @@
 """Implements the exact constraints described in the paper. Pure, but slow."""
-import math
+import wsignal
 from embedding import PartialEmbedding, ENode
 
 # This follows the naming and semantics of the paper as closely as
@@ -65,7 +65,7 @@ class Wrapper:
         self.E = frozenset(
             [
                 (_enode_to_triple(u), _enode_to_triple(v), t)
-                for (u, v, t) in embedding.graph.edges(keys=True)
+                for (u, v, t) in embedding.edges()
             ]
         )
         self.N = frozenset(embedding.infra.nodes())
@@ -102,8 +102,7 @@ class Wrapper:
     def D(self, n1, n2, ninf):
         sinr = self.embedding.infra.sinr(n1, n2, frozenset(ninf))
         bandwidth = self.embedding.infra.bandwidth
-        shannon_capacity = bandwidth * math.log(1 + 10 ** (sinr / 10), 2)
-        return shannon_capacity
+        return wsignal.shannon_capacity(bandwidth, sinr)
 
     def Phat(self, A):
         enodes = set()
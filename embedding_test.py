@@ -4,6 +4,7 @@
 # anyway. When reading particular failing examples, verbosity is good.
 # pylint:disable=too-many-lines
 
+import pytest
 from pytest import approx
 
 from infrastructure import InfrastructureNetwork
@@ -1125,3 +1126,439 @@ def test_self_loop_does_not_interfere():
     assert embedding.take_action(ein, esi, 1)
     # can still send to that node at the same ts
     assert embedding.take_action(eso2, esi, 1)
+
+
+def test_graph_view_matches_tables():
+    """Tests that the networkx view agrees with the indexed tables"""
+    infra = InfrastructureNetwork()
+
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    ni = infra.add_intermediate(name="ni", pos=(1, 0), transmit_power_dbm=30)
+    nsi = infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=0)
+    bsi = overlay.set_sink(name="bsi", datarate=0)
+    overlay.add_link(bso, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+
+    eso = ENode(bso, nso)
+    ein = ENode(bso, ni, bsi)
+    assert embedding.take_action(eso, ein, 0)
+
+    graph = embedding.graph
+    assert set(graph.nodes()) == set(embedding.nodes())
+    assert set(graph.edges(keys=True)) == set(embedding.edges())
+    for enode in embedding.nodes():
+        assert graph.nodes[enode]["chosen"] == embedding.is_chosen(enode)
+    for (u, v, t) in embedding.edges():
+        chosen = embedding.is_edge_chosen(u, v, t)
+        assert graph.edges[(u, v, t)]["chosen"] == chosen
+    assert embedding.is_edge_chosen(eso, ein, 0)
+    assert not embedding.has_edge(eso, ein, 1)
+    assert not embedding.has_node(ENode(bso, nsi, bsi))
+
+
+def test_possibility_index():
+    """Tests that the live action index agrees with the possibilities"""
+    infra = InfrastructureNetwork()
+
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    ni = infra.add_intermediate(name="ni", pos=(1, 0), transmit_power_dbm=30)
+    nsi = infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=5)
+    bin_ = overlay.add_intermediate(name="bin", datarate=5)
+    bsi = overlay.set_sink(name="bsi", datarate=5)
+    overlay.add_link(bso, bin_)
+    overlay.add_link(bin_, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+
+    def check_index():
+        possibilities = embedding.possibilities()
+        assert possibilities == sorted(possibilities)
+        assert embedding.num_possibilities() == len(possibilities)
+        for (u, v, t) in embedding.edges():
+            expected = (u, v, t) in possibilities
+            assert embedding.has_possibility(u, v, t) == expected
+
+    check_index()
+    assert embedding.take_action(ENode(bso, nso), ENode(bin_, ni), 0)
+    check_index()
+    assert not embedding.has_possibility(ENode(bso, nso), ENode(bin_, ni), 0)
+    assert embedding.take_action(ENode(bin_, ni), ENode(bsi, nsi), 1)
+    check_index()
+    assert embedding.num_possibilities() == 0
+
+
+def test_fork_is_independent():
+    """Tests that a forked embedding does not share state"""
+    infra = InfrastructureNetwork()
+
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    ni = infra.add_intermediate(name="ni", pos=(1, 0), transmit_power_dbm=30)
+    nsi = infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=5)
+    bsi = overlay.set_sink(name="bsi", datarate=5)
+    overlay.add_link(bso, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+    eso = ENode(bso, nso)
+    esi = ENode(bsi, nsi)
+    ein = ENode(bso, ni, bsi)
+
+    fork = embedding.fork()
+    assert fork.infra is embedding.infra
+    assert fork.possibilities() == embedding.possibilities()
+
+    # take different routes in both
+    assert embedding.take_action(eso, esi, 0)
+    assert embedding.is_complete()
+    assert not fork.is_complete()
+    assert fork.has_possibility(eso, ein, 0)
+    assert fork.take_action(eso, ein, 0)
+    assert fork.take_action(ein, esi, 1)
+
+    assert fork.is_complete()
+    assert embedding.used_timeslots == 1
+    assert fork.used_timeslots == 2
+    assert not embedding.has_node(ein)
+    assert embedding.construct_link_mappings()[(bso, bsi)] == [
+        (eso, None),
+        (esi, 0),
+    ]
+
+
+def test_rollback_restores_state():
+    """Tests that undo and rollback revert actions exactly"""
+    infra = InfrastructureNetwork()
+
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    ni = infra.add_intermediate(name="ni", pos=(1, 0), transmit_power_dbm=30)
+    nsi = infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=5, requirement=1)
+    bin_ = overlay.add_intermediate(name="bin", datarate=5, requirement=1)
+    bsi = overlay.set_sink(name="bsi", datarate=5, requirement=1)
+    overlay.add_link(bso, bin_)
+    overlay.add_link(bin_, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+    eso = ENode(bso, nso)
+    ein = ENode(bin_, ni)
+    esi = ENode(bsi, nsi)
+
+    def state():
+        # pylint:disable=protected-access
+        return (
+            embedding.possibilities(),
+            embedding.num_possibilities(),
+            sorted(embedding.nodes()),
+            sorted(embedding.edges()),
+            embedding.used_timeslots,
+            dict(embedding.taken_embeddings),
+            dict(embedding._capacity_used),
+            list(embedding.unembedded_requirements()),
+        )
+
+    # nothing to undo yet
+    assert not embedding.undo()
+
+    initial = state()
+    start = embedding.checkpoint()
+    assert embedding.take_action(eso, ein, 0)
+    after_first = state()
+    assert embedding.take_action(ein, esi, 1)
+    assert embedding.is_complete()
+    assert embedding.unembedded_requirements() == []
+
+    assert embedding.undo()
+    assert state() == after_first
+    assert not embedding.is_complete()
+
+    embedding.rollback(start)
+    assert state() == initial
+    assert not embedding.undo()
+
+    # the same actions are possible again
+    assert embedding.take_action(eso, ein, 0)
+    assert embedding.take_action(ein, esi, 1)
+    assert embedding.is_complete()
+
+
+def test_reset_uses_initial_state():
+    """Tests that resets are independent of each other and of the
+    state they were reset from"""
+    infra = InfrastructureNetwork()
+
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    ni = infra.add_intermediate(name="ni", pos=(1, 0), transmit_power_dbm=30)
+    nsi = infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=5)
+    bsi = overlay.set_sink(name="bsi", datarate=5)
+    overlay.add_link(bso, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+    eso = ENode(bso, nso)
+    ein = ENode(bso, ni, bsi)
+    initial_possibilities = embedding.possibilities()
+
+    assert embedding.take_action(eso, ein, 0)
+    first_reset = embedding.reset()
+    assert first_reset.possibilities() == initial_possibilities
+    assert first_reset.used_timeslots == 0
+
+    assert first_reset.take_action(eso, ENode(bsi, nsi), 0)
+    assert first_reset.is_complete()
+
+    # neither the original nor the earlier reset influence this one
+    second_reset = first_reset.reset()
+    assert second_reset.possibilities() == initial_possibilities
+    assert not second_reset.is_complete()
+    assert embedding.has_node(ein)
+    assert embedding.is_chosen(ein)
+
+
+def test_open_timeslot_matches_feasibility():
+    """Tests that the edges of the implicit open timeslot are exactly
+    the feasible and necessary connections"""
+    infra = InfrastructureNetwork()
+
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    ni = infra.add_intermediate(name="ni", pos=(1, 0), transmit_power_dbm=30)
+    infra.add_intermediate(name="nf", pos=(90, 0), transmit_power_dbm=30)
+    nsi = infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=5, requirement=1)
+    bin_ = overlay.add_intermediate(name="bin", datarate=5, requirement=1)
+    bsi = overlay.set_sink(name="bsi", datarate=5, requirement=1)
+    overlay.add_link(bso, bin_)
+    overlay.add_link(bin_, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+
+    def check_open_timeslot():
+        last_ts = embedding.used_timeslots
+        in_open = {(u, v) for (u, v, t) in embedding.edges() if t == last_ts}
+        expected = set()
+        for u in embedding.nodes():
+            for v in embedding.nodes():
+                if (u.acting_as, v.target) not in overlay.links():
+                    continue
+                if v.relay and v.acting_as != u.acting_as:
+                    continue
+                if u.relay and u.target != v.target:
+                    continue
+                (infeasible, _) = embedding.why_infeasible(u, v, last_ts)
+                if not infeasible:
+                    expected.add((u, v))
+        assert in_open == expected
+
+    check_open_timeslot()
+    assert embedding.take_action(ENode(bso, nso), ENode(bin_, ni), 0)
+    check_open_timeslot()
+    assert embedding.take_action(ENode(bin_, ni), ENode(bsi, nsi), 1)
+    check_open_timeslot()
+
+
+def test_too_weak_links_are_never_added():
+    """Tests that links which can not carry the datarate even without
+    interference are pruned in every timeslot"""
+    infra = InfrastructureNetwork()
+
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    nfar = infra.add_intermediate(
+        name="nfar", pos=(500, 0), transmit_power_dbm=30
+    )
+    nsi = infra.set_sink(name="nsi", pos=(1, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=5, requirement=0)
+    bin_ = overlay.add_intermediate(name="bin", datarate=5, requirement=0)
+    bsi = overlay.set_sink(name="bsi", datarate=5, requirement=0)
+    overlay.add_link(bso, bin_)
+    overlay.add_link(bso, bsi)
+    overlay.add_link(bin_, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+    source = ENode(bso, nso)
+    far = ENode(bin_, nfar)
+
+    assert embedding.why_infeasible(source, far, 0) == (
+        True,
+        "Link too weak even without interference",
+    )
+    # makes timeslot 0 a used one
+    assert embedding.take_action(source, ENode(bsi, nsi), 0)
+    assert embedding.used_timeslots == 1
+    for ts in range(embedding.used_timeslots + 1):
+        assert not embedding.has_edge(source, far, ts)
+        assert not embedding.try_add_edge(source, far, ts)
+
+
+def test_breaking_senders_agree_with_capacity():
+    """Tests that the vectorized interference check agrees with the
+    capacity of the chosen connections"""
+    # pylint:disable=protected-access
+    infra = InfrastructureNetwork()
+    n1 = infra.add_source(name="n1", pos=(0, 0), transmit_power_dbm=30)
+    n2 = infra.add_source(name="n2", pos=(10, 0), transmit_power_dbm=30)
+    infra.add_intermediate(name="n3", pos=(2, 1), transmit_power_dbm=20)
+    infra.add_intermediate(name="n4", pos=(30, 5), transmit_power_dbm=30)
+    nsi = infra.set_sink(name="nsi", pos=(1, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    b1 = overlay.add_source(name="b1", datarate=2)
+    b2 = overlay.add_source(name="b2", datarate=1)
+    bsi = overlay.set_sink(name="bsi", datarate=5)
+    overlay.add_link(b1, bsi)
+    overlay.add_link(b2, bsi)
+
+    embedding = PartialEmbedding(
+        infra, overlay, source_mapping=[(b1, n1), (b2, n2)]
+    )
+    assert embedding.take_action(ENode(b1, n1), ENode(bsi, nsi), 0)
+
+    def breaks_by_capacity(node):
+        for (u, v) in embedding._transmissions_at[0]:
+            capacity = embedding.known_capacity(
+                u.node, v.node, timeslot=0, additional_senders={node}
+            )
+            if capacity < overlay.datarate(u.acting_as):
+                return True
+        return False
+
+    results = set()
+    for node in infra.nodes():
+        expected = breaks_by_capacity(node)
+        assert embedding._invalidates_chosen(ENode(b2, node), 0) == expected
+        results.add(expected)
+    # both cases are covered
+    assert results == {True, False}
+
+
+def test_accumulated_interference_matches_sinr():
+    """Tests that the per-timeslot interference accumulator agrees with
+    computing the SINR from scratch"""
+    infra = InfrastructureNetwork()
+    n1 = infra.add_source(name="n1", pos=(0, 0), transmit_power_dbm=30)
+    n2 = infra.add_source(name="n2", pos=(4, 0), transmit_power_dbm=25)
+    n3 = infra.add_intermediate(name="n3", pos=(2, 3), transmit_power_dbm=20)
+    nsi = infra.set_sink(name="nsi", pos=(1, 1), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    b1 = overlay.add_source(name="b1", datarate=0)
+    b2 = overlay.add_source(name="b2", datarate=0)
+    bsi = overlay.set_sink(name="bsi", datarate=0)
+    overlay.add_link(b1, bsi)
+    overlay.add_link(b2, bsi)
+
+    embedding = PartialEmbedding(
+        infra, overlay, source_mapping=[(b1, n1), (b2, n2)]
+    )
+    assert embedding.take_action(ENode(b1, n1), ENode(b1, n3, bsi), 0)
+    assert embedding.take_action(ENode(b2, n2), ENode(bsi, nsi), 0)
+
+    for u in infra.nodes():
+        for v in infra.nodes():
+            if u == v:
+                continue
+            for additional in [set(), {n3}, {n1, nsi}]:
+                senders = frozenset({n1, n2}.union(additional).difference({u}))
+                expected = infra.sinr(u, v, senders)
+                actual = embedding.known_sinr(u, v, 0, additional)
+                assert actual == approx(expected)
+
+
+def test_embedding_follows_infrastructure_changes():
+    """Tests that the possible connections are updated when nodes move
+    or are removed"""
+    infra = InfrastructureNetwork()
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    nrelay = infra.add_intermediate(
+        name="nrelay", pos=(1, 0), transmit_power_dbm=30
+    )
+    nsi = infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=5, requirement=0)
+    bsi = overlay.set_sink(name="bsi", datarate=5, requirement=0)
+    overlay.add_link(bso, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+    source = ENode(bso, nso)
+    relay = ENode(bso, nrelay, bsi)
+    assert embedding.has_possibility(source, relay, 0)
+
+    infra.move_node(nrelay, (500, 0))
+    assert not embedding.has_possibility(source, relay, 0)
+    assert not embedding.reset().has_possibility(source, relay, 0)
+
+    infra.move_node(nrelay, (1, 0))
+    assert embedding.has_possibility(source, relay, 0)
+
+    assert embedding.take_action(source, ENode(bsi, nsi), 0)
+    assert not embedding.infeasible_chosen_connections()
+    infra.set_power(nso, -30)
+    assert embedding.infeasible_chosen_connections() == [
+        (source, ENode(bsi, nsi), 0)
+    ]
+
+    with pytest.raises(ValueError):
+        infra.remove_node(nsi)
+    infra.remove_node(nrelay)
+    assert not embedding.has_node(relay)
+    assert embedding.reset().has_node(ENode(bsi, nsi))
+    assert not embedding.reset().has_node(relay)
+
+
+def test_enode_columns_follow_rollback():
+    """Tests that the cached enode columns match the enodes, also when
+    a rollback frees indices that other enodes take"""
+    infra = InfrastructureNetwork()
+    nso1 = infra.add_source(name="nso1", pos=(0, 0), transmit_power_dbm=30)
+    nso2 = infra.add_source(name="nso2", pos=(3, 1), transmit_power_dbm=30)
+    infra.add_intermediate(
+        name="n1", pos=(1, 1), transmit_power_dbm=25, capacity=3
+    )
+    infra.set_sink(name="nsi", pos=(4, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso1 = overlay.add_source(name="bso1", datarate=2, requirement=0)
+    bso2 = overlay.add_source(name="bso2", datarate=1, requirement=0)
+    bin1 = overlay.add_intermediate(name="bin1", datarate=2, requirement=1)
+    bsi = overlay.set_sink(name="bsi", datarate=1, requirement=0)
+    overlay.add_link(bso1, bin1)
+    overlay.add_link(bin1, bsi)
+    overlay.add_link(bso2, bsi)
+
+    embedding = PartialEmbedding(
+        infra, overlay, source_mapping=[(bso1, nso1), (bso2, nso2)]
+    )
+
+    def check():
+        column = embedding.enode_column("repr", repr, dtype=object)
+        assert column.tolist() == [
+            repr(enode) for enode in embedding.enode_table()
+        ]
+
+    check()
+    start = embedding.checkpoint()
+    # enodes that are not part of the graph yet take the same index
+    # after each rollback
+    for node in ["n1", "nsi"]:
+        enode = ENode(bso1, node)
+        assert embedding.try_add_enode(enode)
+        assert embedding.enode_table()[-1] == enode
+        check()
+        embedding.rollback(start)
+        check()
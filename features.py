@@ -1,5 +1,9 @@
 """Various candidates for node and edge features"""
 
+from collections import defaultdict
+
+import numpy as np
+
 from embedding import PartialEmbedding, ENode
 
 
@@ -20,15 +24,47 @@ def _postprocess_feature(feature):
     return [float(value) for value in feature]
 
 
-class Feature:
-    """A feature extractor"""
+def _postprocess_block(block, count, dim):
+    """Make a block of features (one row per element) compatible with
+    graph tuples"""
+    return np.asarray(block, dtype=float).reshape(count, dim)
 
-    def __init__(self, name, edge_fun, node_fun, edge_dim, node_dim):
+
+class Feature:
+    """A feature extractor. The batch functions are optional, columnar
+    versions of the per element functions (which are the reference).
+    They get the `SharedValues` of the observation instead of the
+    embedding.
+
+    `depends_on` lists what (besides the element itself being added)
+    can change the value of a feature, so that it can be updated
+    incrementally: "chosen" (the element is chosen), "capacity" (the
+    remaining capacity of the node changes), "embedded_blocks" (any
+    block is embedded), "senders" (the senders in the timeslot of an
+    edge change) and "timeslot" (a timeslot is opened). None means it
+    could depend on anything.
+    """
+
+    def __init__(
+        # pylint: disable=too-many-arguments
+        self,
+        name,
+        edge_fun,
+        node_fun,
+        edge_dim,
+        node_dim,
+        edge_batch_fun=None,
+        node_batch_fun=None,
+        depends_on=None,
+    ):
         self.name = name
         self.edge_dim = edge_dim
         self.node_dim = node_dim
         self.edge_fun = edge_fun
         self.node_fun = node_fun
+        # columnar versions of edge_fun and node_fun, if any
+        self._batch_funs = {"edge": edge_batch_fun, "node": node_batch_fun}
+        self.depends_on = None if depends_on is None else frozenset(depends_on)
 
     def process_edge(
         self,
@@ -58,33 +94,173 @@ class Feature:
         assert len(feature) == self.node_dim
         return feature
 
+    def process_edges(
+        # pylint: disable=too-many-arguments
+        self,
+        embedding: PartialEmbedding,
+        sources,
+        targets,
+        timeslots,
+        shared=None,
+    ):
+        """Extracts a feature from many edges, given as arrays of source
+        and target enode indices and timeslots. Returns a (count, dim)
+        array. Intermediate values can be shared with other features of
+        the same observation and edges through `shared`."""
+        count = len(sources)
+        if self.edge_fun is None:
+            return np.zeros((count, 0))
+        batch_fun = self._batch_funs["edge"]
+        if batch_fun is None:
+            enodes = embedding.enode_table()
+            return _postprocess_block(
+                [
+                    self.process_edge(
+                        embedding, enodes[source], enodes[target], int(ts)
+                    )
+                    for (source, target, ts) in zip(
+                        sources, targets, timeslots
+                    )
+                ],
+                count,
+                self.edge_dim,
+            )
+        if shared is None:
+            shared = SharedValues(embedding)
+        block = batch_fun(shared, sources, targets, timeslots)
+        return _postprocess_block(block, count, self.edge_dim)
+
+    def process_nodes(self, embedding: PartialEmbedding, indices, shared=None):
+        """Extracts a feature from many nodes, given as an array of enode
+        indices. Returns a (count, dim) array. Intermediate values can be
+        shared with other features of the same observation through
+        `shared`."""
+        count = len(indices)
+        if self.node_fun is None:
+            return np.zeros((count, 0))
+        batch_fun = self._batch_funs["node"]
+        if batch_fun is None:
+            enodes = embedding.enode_table()
+            return _postprocess_block(
+                [self.process_node(embedding, enodes[i]) for i in indices],
+                count,
+                self.node_dim,
+            )
+        if shared is None:
+            shared = SharedValues(embedding)
+        block = batch_fun(shared, indices)
+        return _postprocess_block(block, count, self.node_dim)
+
 
 class NodeFeature(Feature):
     """A node feature extractor"""
 
-    def __init__(self, name, compute_fun, dim=1):
+    def __init__(
+        # pylint: disable=too-many-arguments
+        self,
+        name,
+        compute_fun,
+        dim=1,
+        batch_fun=None,
+        depends_on=None,
+    ):
         super().__init__(
             "node_" + name,
             edge_dim=0,
             edge_fun=None,
             node_dim=dim,
             node_fun=compute_fun,
+            node_batch_fun=batch_fun,
+            depends_on=depends_on,
         )
 
 
 class EdgeFeature(Feature):
     """An edge feature extractor"""
 
-    def __init__(self, name, compute_fun, dim=1):
+    def __init__(
+        # pylint: disable=too-many-arguments
+        self,
+        name,
+        compute_fun,
+        dim=1,
+        batch_fun=None,
+        depends_on=None,
+    ):
         super().__init__(
             "edge_" + name,
             edge_dim=dim,
             edge_fun=compute_fun,
             node_dim=0,
             node_fun=None,
+            edge_batch_fun=batch_fun,
+            depends_on=depends_on,
         )
 
 
+def frac_array(a, b):
+    """Like `frac`, for arrays"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((a == 0) & (b == 0), 0.0, a / b)
+
+
+class SharedValues:
+    """Intermediate values that several features need, computed at most
+    once per observation. Values for the whole observation (like columns
+    over all enodes by index) are shared with every `for_edges` copy,
+    values for edges only hold for the edges they were computed for."""
+
+    def __init__(self, embedding: PartialEmbedding, observation=None):
+        self.embedding = embedding
+        self._observation = dict() if observation is None else observation
+        self._edges = dict()
+
+    def for_edges(self):
+        """Values for another set of edges of the same observation"""
+        return SharedValues(self.embedding, self._observation)
+
+    def get(self, name, compute):
+        """A value for the whole observation, computed on first use"""
+        if name not in self._observation:
+            self._observation[name] = compute()
+        return self._observation[name]
+
+    def get_for_edges(self, name, compute):
+        """A value for the edges of this object, computed on first use"""
+        if name not in self._edges:
+            self._edges[name] = compute()
+        return self._edges[name]
+
+
+def _enode_column(shared, name, fun, dtype=None):
+    """Evaluates a function for every enode, by index, once per
+    observation"""
+    return shared.get(
+        name,
+        lambda: np.array(
+            [fun(enode) for enode in shared.embedding.enode_table()],
+            dtype=dtype,
+        ),
+    )
+
+
+def _fixed_column(shared, name, fun, dtype=None):
+    """Like `_enode_column`, for values that only depend on the enode
+    and the infrastructure. The embedding keeps these across
+    observations and only evaluates the function for new enodes."""
+    return shared.embedding.enode_column(name, fun, dtype)
+
+
+def _infra_node_column(shared):
+    """The infrastructure node index of every enode"""
+    index = shared.embedding.infra.node_index()
+    return _fixed_column(
+        shared, "infra_node", lambda enode: index[enode.node], dtype=int
+    )
+
+
 def _is_broadcast(embedding, source, target, timeslot):
     for (other_so, other_ta) in embedding.taken_edges_in[timeslot]:
         if other_so == source and other_ta == target:
@@ -98,7 +274,7 @@ def _is_broadcast(embedding, source, target, timeslot):
 
 def _remaining_capacity_before_chosen(emb, enode):
     remaining = emb.remaining_capacity(enode.node)
-    if emb.graph.nodes[enode]["chosen"]:
+    if emb.is_chosen(enode):
         remaining += emb.overlay.requirement(enode.block)
     return remaining
 
@@ -106,27 +282,16 @@ def _remaining_capacity_before_chosen(emb, enode):
 def _options_lost(embedding: PartialEmbedding, enode: ENode):
     weight = embedding.overlay.requirement(enode.block)
     remaining = _remaining_capacity_before_chosen(embedding, enode)
+    remaining_after = remaining - weight
 
-    not_yet_embedded = set(embedding.overlay.blocks()).difference(
-        embedding.taken_embeddings.keys()
-    )
-
-    # assuming the node was chosen
-    not_yet_embedded = not_yet_embedded.difference({enode.block})
-
-    options_before = {
-        block
-        for block in not_yet_embedded
-        if embedding.overlay.requirement(block) < remaining
-    }
+    options_before = embedding.num_unembedded_below(remaining)
+    options_after = embedding.num_unembedded_below(remaining_after)
 
-    remaining_after = remaining - weight
-    options_after = {
-        block
-        for block in not_yet_embedded
-        if embedding.overlay.requirement(block) < remaining_after
-    }
-    return len(options_before) - len(options_after)
+    # assuming the node was chosen, its own block is not an option
+    if not enode.relay and enode.block not in embedding.taken_embeddings:
+        options_before -= weight < remaining
+        options_after -= weight < remaining_after
+    return options_before - options_after
 
 
 def _capacity(emb, u, v, t):
@@ -138,21 +303,218 @@ def _capacity(emb, u, v, t):
     return emb.known_capacity(u.node, v.node, t)
 
 
+def _pos_batch(shared, idx):
+    infra = shared.embedding.infra
+    return _fixed_column(
+        shared, "pos", lambda enode: infra.position(enode.node), dtype=float
+    )[idx]
+
+
+def _relay_batch(shared, idx):
+    return _fixed_column(
+        shared, "relay", lambda enode: enode.relay, dtype=bool
+    )[idx]
+
+
+def _sink_batch(shared, idx):
+    infra_sink = shared.embedding.infra.sink
+    overlay_sink = shared.embedding.overlay.sink
+    return _fixed_column(
+        shared,
+        "sink",
+        lambda enode: enode.node == infra_sink
+        and enode.block == overlay_sink,
+        dtype=bool,
+    )[idx]
+
+
+def _requirement_batch(shared, idx):
+    requirement = shared.embedding.overlay.requirement
+    return _fixed_column(
+        shared,
+        "requirement",
+        lambda enode: requirement(enode.block),
+        dtype=float,
+    )[idx]
+
+
+def _remaining_capacity_before_chosen_column(shared):
+    """The remaining capacity of the node of every enode (by index),
+    assuming the enode is not chosen"""
+    emb = shared.embedding
+
+    def compute():
+        remaining = _enode_column(
+            shared,
+            "remaining_capacity",
+            lambda enode: emb.remaining_capacity(enode.node),
+            dtype=float,
+        )
+        everything = np.arange(len(remaining))
+        return remaining + np.where(
+            emb.enode_chosen_array(),
+            _requirement_batch(shared, everything),
+            0.0,
+        )
+
+    return shared.get("remaining_capacity_before_chosen", compute)
+
+
+def _remaining_capacity_before_chosen_batch(shared, idx):
+    return _remaining_capacity_before_chosen_column(shared)[idx]
+
+
+def _compute_fraction_batch(shared, idx):
+    return frac_array(
+        _requirement_batch(shared, idx),
+        _remaining_capacity_before_chosen_batch(shared, idx),
+    )
+
+
+def _options_lost_batch(shared, idx):
+    emb = shared.embedding
+    weight = _requirement_batch(shared, idx)
+    remaining = _remaining_capacity_before_chosen_batch(shared, idx)
+    remaining_after = remaining - weight
+
+    requirements = shared.get(
+        "unembedded_requirements",
+        lambda: np.array(emb.unembedded_requirements(), dtype=float),
+    )
+    options_before = np.searchsorted(requirements, remaining)
+    options_after = np.searchsorted(requirements, remaining_after)
+
+    # assuming the node was chosen, its own block is not an option
+    own_unembedded = _enode_column(
+        shared,
+        "own_block_unembedded",
+        lambda enode: not enode.relay
+        and enode.block not in emb.taken_embeddings,
+        dtype=bool,
+    )[idx]
+    options_before -= own_unembedded & (weight < remaining)
+    options_after -= own_unembedded & (weight < remaining_after)
+    return options_before - options_after
+
+
+def _known_capacity_batch(shared, sources, targets, timeslots):
+    """The known capacity of every edge, including loops"""
+    node_of = _infra_node_column(shared)
+    return shared.get_for_edges(
+        "known_capacity",
+        lambda: shared.embedding.known_capacity_array(
+            node_of[sources], node_of[targets], timeslots
+        ),
+    )
+
+
+def _capacity_batch(shared, sources, targets, timeslots):
+    node_of = _infra_node_column(shared)
+    loop = node_of[sources] == node_of[targets]
+    capacity = _known_capacity_batch(shared, sources, targets, timeslots)
+    return np.where(loop, _requirement_of_acting_as(shared)[sources], capacity)
+
+
+def _requirement_of_acting_as(shared):
+    requirement = shared.embedding.overlay.requirement
+    return _fixed_column(
+        shared,
+        "requirement_of_acting_as",
+        lambda enode: requirement(enode.acting_as),
+        dtype=float,
+    )
+
+
+def _datarate_batch(shared, sources, _targets, _timeslots):
+    datarate = shared.embedding.overlay.datarate
+    return _fixed_column(
+        shared,
+        "datarate",
+        lambda enode: datarate(enode.acting_as),
+        dtype=float,
+    )[sources]
+
+
+def _datarate_fraction_batch(shared, sources, targets, timeslots):
+    capacity = _known_capacity_batch(shared, sources, targets, timeslots)
+    datarate = _datarate_batch(shared, sources, targets, timeslots)
+    return frac_array(datarate, capacity)
+
+
+def _is_broadcast_batch(shared, sources, targets, timeslots):
+    emb = shared.embedding
+    # senders are identified by their (block, node), relays share the
+    # block None
+    def compute():
+        codes = dict()
+        column = np.array(
+            [
+                codes.setdefault((enode.block, enode.node), len(codes))
+                for enode in emb.enode_table()
+            ],
+            dtype=int,
+        )
+        return (codes, column)
+
+    (codes, sender_code) = shared.get("sender_codes", compute)
+    # number of actual transmissions per (timeslot, sender)
+    sending = defaultdict(int)
+    for (timeslot, taken) in emb.taken_edges_in.items():
+        for (other_so, other_ta) in taken:
+            if other_so.node != other_ta.node:
+                code = codes[(other_so.block, other_so.node)]
+                sending[timeslot * len(codes) + code] += 1
+    if not sending:
+        return np.zeros(len(sources), dtype=bool)
+
+    keys = np.asarray(timeslots) * len(codes) + sender_code[sources]
+    sending_keys = np.array(sorted(sending))
+    sending_counts = np.array([sending[key] for key in sending_keys])
+    pos = np.minimum(
+        np.searchsorted(sending_keys, keys), len(sending_keys) - 1
+    )
+    count = np.where(sending_keys[pos] == keys, sending_counts[pos], 0)
+
+    # the edge itself does not count
+    node_of = _infra_node_column(shared)
+    itself = emb.is_edge_chosen_array(sources, targets, timeslots) & (
+        node_of[sources] != node_of[targets]
+    )
+    return count - itself > 0
+
+
 SUPPORTED_FEATURES = [
     NodeFeature(
         "pos",
         lambda emb, enode: emb.infra.graph.node[enode.node]["pos"],
         dim=2,
+        batch_fun=_pos_batch,
+        depends_on=(),
+    ),
+    NodeFeature(
+        "relay",
+        lambda emb, enode: enode.relay,
+        batch_fun=_relay_batch,
+        depends_on=(),
     ),
-    NodeFeature("relay", lambda emb, enode: enode.relay),
     NodeFeature(
         "sink",
         lambda emb, enode: enode.node == emb.infra.sink
         and enode.block == emb.overlay.sink,
+        batch_fun=_sink_batch,
+        depends_on=(),
+    ),
+    NodeFeature(
+        "remaining_capacity",
+        _remaining_capacity_before_chosen,
+        batch_fun=_remaining_capacity_before_chosen_batch,
+        depends_on=("chosen", "capacity"),
     ),
-    NodeFeature("remaining_capacity", _remaining_capacity_before_chosen),
     NodeFeature(
-        "weight", lambda emb, enode: emb.overlay.requirement(enode.block)
+        "weight",
+        lambda emb, enode: emb.overlay.requirement(enode.block),
+        batch_fun=_requirement_batch,
+        depends_on=(),
     ),
     NodeFeature(
         "compute_fraction",
@@ -160,19 +522,47 @@ SUPPORTED_FEATURES = [
             emb.overlay.requirement(enode.block),
             _remaining_capacity_before_chosen(emb, enode),
         ),
+        batch_fun=_compute_fraction_batch,
+        depends_on=("chosen", "capacity"),
+    ),
+    NodeFeature(
+        "options_lost",
+        _options_lost,
+        batch_fun=_options_lost_batch,
+        depends_on=("chosen", "capacity", "embedded_blocks"),
+    ),
+    EdgeFeature(
+        "timeslot",
+        lambda emb, u, v, t: t,
+        batch_fun=lambda shared, sources, targets, timeslots: timeslots,
+        depends_on=("timeslot",),
+    ),
+    EdgeFeature(
+        "chosen",
+        lambda emb, u, v, t: emb.is_edge_chosen(u, v, t),
+        batch_fun=lambda shared, *edges: shared.embedding.is_edge_chosen_array(
+            *edges
+        ),
+        depends_on=("chosen",),
     ),
-    NodeFeature("options_lost", _options_lost),
-    EdgeFeature("timeslot", lambda emb, u, v, t: t),
     EdgeFeature(
-        "chosen", lambda emb, u, v, t: emb.graph.edges[u, v, t]["chosen"]
+        "capacity",
+        _capacity,
+        batch_fun=_capacity_batch,
+        depends_on=("senders",),
     ),
-    EdgeFeature("capacity", _capacity),
     EdgeFeature(
-        "additional_timeslot", lambda emb, u, v, t: t >= emb.used_timeslots
+        "additional_timeslot",
+        lambda emb, u, v, t: t >= emb.used_timeslots,
+        batch_fun=lambda shared, sources, targets, timeslots: timeslots
+        >= shared.embedding.used_timeslots,
+        depends_on=("timeslot",),
     ),
     EdgeFeature(
         "datarate_requirement",
         lambda emb, u, v, t: emb.overlay.datarate(u.acting_as),
+        batch_fun=_datarate_batch,
+        depends_on=(),
     ),
     EdgeFeature(
         "datarate_fraction",
@@ -180,8 +570,15 @@ SUPPORTED_FEATURES = [
             emb.overlay.datarate(u.acting_as),
             emb.known_capacity(u.node, v.node, t),
         ),
+        batch_fun=_datarate_fraction_batch,
+        depends_on=("senders",),
+    ),
+    EdgeFeature(
+        "is_broadcast",
+        _is_broadcast,
+        batch_fun=_is_broadcast_batch,
+        depends_on=("chosen", "senders"),
     ),
-    EdgeFeature("is_broadcast", _is_broadcast),
 ]
 
 
@@ -191,3 +588,50 @@ def features_by_name():
     for feature in SUPPORTED_FEATURES:
         result[feature.name] = feature
     return result
+
+
+class FeatureList:
+    """A list of features (like the configured
+    `hyperparameters.DEFAULT_FEATURES`) that are extracted one after
+    the other into a single block. The features share one
+    `SharedValues` per observation, which computes the intermediate
+    values they have in common on first use."""
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.node_dim = sum(feature.node_dim for feature in self.features)
+        self.edge_dim = sum(feature.edge_dim for feature in self.features)
+
+    def extract_nodes(self, embedding: PartialEmbedding, idx, shared=None):
+        """The features of many enodes (by index) as a (count, node_dim)
+        array"""
+        if shared is None:
+            shared = SharedValues(embedding)
+        blocks = [np.zeros((len(idx), 0))]
+        for feature in self.features:
+            blocks.append(feature.process_nodes(embedding, idx, shared))
+        return np.hstack(blocks)
+
+    def extract_edges(
+        # pylint: disable=too-many-arguments
+        self,
+        embedding: PartialEmbedding,
+        sources,
+        targets,
+        timeslots,
+        shared=None,
+    ):
+        """The features of many edges, given as arrays of source and
+        target enode indices and timeslots, as a (count, edge_dim)
+        array"""
+        shared = (
+            SharedValues(embedding) if shared is None else shared.for_edges()
+        )
+        blocks = [np.zeros((len(sources), 0))]
+        for feature in self.features:
+            blocks.append(
+                feature.process_edges(
+                    embedding, sources, targets, timeslots, shared
+                )
+            )
+        return np.hstack(blocks)
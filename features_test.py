@@ -11,7 +11,70 @@ from pytest import approx
 from infrastructure import InfrastructureNetwork
 from overlay import OverlayNetwork
 from embedding import PartialEmbedding, ENode
-from features import features_by_name
+from features import (
+    features_by_name,
+    FeatureList,
+    SharedValues,
+    SUPPORTED_FEATURES,
+)
+from observation import ObservationBuilder, IncrementalObservationBuilder
+
+
+def check_batch_matches_elementwise(embedding):
+    """Checks that the batch extraction agrees with the per-element
+    reference for every supported feature"""
+    enodes = embedding.enode_table()
+    idx = embedding.enode_indices()
+    assert [enodes[i] for i in idx] == embedding.nodes()
+    (sources, targets, timeslots) = embedding.edge_arrays()
+    edges = [
+        (enodes[u], enodes[v], int(t))
+        for (u, v, t) in zip(sources, targets, timeslots)
+    ]
+    assert edges == embedding.edges()
+
+    for feature in SUPPORTED_FEATURES:
+        block = feature.process_nodes(embedding, idx)
+        expected = [feature.process_node(embedding, enodes[i]) for i in idx]
+        assert block.shape == (len(idx), feature.node_dim)
+        assert_rows_equal(block, expected)
+
+        block = feature.process_edges(embedding, sources, targets, timeslots)
+        expected = [feature.process_edge(embedding, *edge) for edge in edges]
+        assert block.shape == (len(edges), feature.edge_dim)
+        assert_rows_equal(block, expected)
+
+    builder = ObservationBuilder(SUPPORTED_FEATURES)
+    block = builder.extract_node_feature_block(embedding, idx)
+    expected = [
+        builder.extract_node_features(embedding, enodes[i]) for i in idx
+    ]
+    assert_rows_equal(block, expected)
+    block = builder.extract_edge_feature_block(
+        embedding, sources, targets, timeslots
+    )
+    expected = [builder.extract_edge_features(embedding, *e) for e in edges]
+    assert_rows_equal(block, expected)
+
+    (arrays, actions) = builder.get_observation_arrays(embedding)
+    assert arrays["n_node"].tolist() == [len(idx)]
+    assert arrays["n_edge"].tolist() == [len(edges)]
+    assert_rows_equal(arrays["edges"], block)
+    nodes = embedding.nodes()
+    for ((u, v, _), sender, receiver) in zip(
+        edges, arrays["senders"], arrays["receivers"]
+    ):
+        assert (nodes[sender], nodes[receiver]) == (u, v)
+    assert sorted(actions) == sorted(embedding.possibilities())
+
+
+def assert_rows_equal(block, rows):
+    """Compares a feature block to a list of feature rows"""
+    expected = np.array(rows, dtype=float).reshape(block.shape)
+    # the datarate fraction of a loop is undefined (inf / inf) while
+    # another node at the same position is sending
+    assert block == approx(expected, nan_ok=True)
+
 
 # easiest to do everything in one function, although it isn't pretty
 def test_features():
@@ -162,6 +225,8 @@ def test_features():
     # since eso1 -> erelay1 is already chosen, broadcast
     assert edge_feature("is_broadcast", eso1, ENode(bin2, nsi), 0)[0] == 1
 
+    check_batch_matches_elementwise(embedding)
+
     print(embedding.why_infeasible(eso2, ENode(bin3, nso2), 0))
     # take a loop in nso2
     assert embedding.take_action(eso2, ENode(bin3, nso2), 2)
@@ -172,3 +237,148 @@ def test_features():
     # to ein1 in ts 1
     erelay2 = ENode(bso1, ninterm, bin2)
     assert edge_feature("is_broadcast", erelay2, ENode(bin2, nso2), 1)[0] == 1
+
+    check_batch_matches_elementwise(embedding)
+    check_batch_matches_elementwise(embedding.reset())
+
+
+def observation_by_element(embedding, arrays, actions):
+    """Keys the rows of an observation by the elements they represent"""
+    nodes = embedding.nodes()
+    node_rows = {
+        enode: row.tolist() for (enode, row) in zip(nodes, arrays["nodes"])
+    }
+    edge_rows = {
+        (nodes[u], nodes[v], int(row[1])): row.tolist()
+        for (u, v, row) in zip(
+            arrays["senders"], arrays["receivers"], arrays["edges"]
+        )
+    }
+    assert len(edge_rows) == arrays["n_edge"][0]
+    return (node_rows, edge_rows, sorted(actions))
+
+
+def test_incremental_observation_matches_full():
+    """Tests that patching the previous observation gives the same result
+    as building it from scratch, also across rollbacks"""
+    infra = InfrastructureNetwork()
+    nso1 = infra.add_source(name="nso1", pos=(0, 0), transmit_power_dbm=30)
+    nso2 = infra.add_source(name="nso2", pos=(3, 1), transmit_power_dbm=30)
+    infra.add_intermediate(
+        name="n1", pos=(1, 1), transmit_power_dbm=25, capacity=3
+    )
+    infra.add_intermediate(
+        name="n2", pos=(2, 0), transmit_power_dbm=30, capacity=1
+    )
+    infra.set_sink(name="nsi", pos=(4, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso1 = overlay.add_source(name="bso1", datarate=2, requirement=0)
+    bso2 = overlay.add_source(name="bso2", datarate=1, requirement=0)
+    bin1 = overlay.add_intermediate(name="bin1", datarate=2, requirement=1)
+    bsi = overlay.set_sink(name="bsi", datarate=1, requirement=0)
+    overlay.add_link(bso1, bin1)
+    overlay.add_link(bin1, bsi)
+    overlay.add_link(bso2, bsi)
+
+    embedding = PartialEmbedding(
+        infra, overlay, source_mapping=[(bso1, nso1), (bso2, nso2)]
+    )
+    full = ObservationBuilder(SUPPORTED_FEATURES)
+    incremental = IncrementalObservationBuilder(SUPPORTED_FEATURES)
+
+    def check():
+        expected = observation_by_element(
+            embedding, *full.get_observation_arrays(embedding)
+        )
+        actual = observation_by_element(
+            embedding, *incremental.get_observation_arrays(embedding)
+        )
+        assert actual == expected
+        # the enode columns kept by the embedding are still up to date
+        check_batch_matches_elementwise(embedding)
+
+    check()
+    token = embedding.checkpoint()
+    rand = np.random.RandomState(42)
+    undone = False
+    while embedding.possibilities():
+        possibilities = embedding.possibilities()
+        assert embedding.take_action(
+            *possibilities[rand.randint(len(possibilities))]
+        )
+        check()
+        if embedding.used_timeslots == 2 and not undone:
+            assert embedding.undo()
+            undone = True
+            check()
+    embedding.rollback(token)
+    check()
+    infra.move_node(nso2, (3, 2))
+    check()
+
+
+def test_feature_list_shares_intermediates():
+    """Tests that a feature list agrees with the separate features
+    while computing shared values only once"""
+    infra = InfrastructureNetwork()
+    nso = infra.add_source(name="nso", pos=(0, 0), transmit_power_dbm=30)
+    infra.add_intermediate(
+        name="n1", pos=(1, 1), transmit_power_dbm=30, capacity=2
+    )
+    infra.set_sink(name="nsi", pos=(2, 0), transmit_power_dbm=30)
+
+    overlay = OverlayNetwork()
+    bso = overlay.add_source(name="bso", datarate=2, requirement=0)
+    bin1 = overlay.add_intermediate(name="bin1", datarate=1, requirement=1)
+    bsi = overlay.set_sink(name="bsi", datarate=1, requirement=0)
+    overlay.add_link(bso, bin1)
+    overlay.add_link(bin1, bsi)
+
+    embedding = PartialEmbedding(infra, overlay, source_mapping=[(bso, nso)])
+    assert embedding.take_action(*embedding.possibilities()[0])
+
+    calls = []
+    known_capacity_array = embedding.known_capacity_array
+
+    def counting_known_capacity_array(*args):
+        calls.append(args)
+        return known_capacity_array(*args)
+
+    embedding.known_capacity_array = counting_known_capacity_array
+
+    by_name = features_by_name()
+    features = [
+        by_name[name]
+        for name in [
+            "node_remaining_capacity",
+            "node_compute_fraction",
+            "node_options_lost",
+            "edge_capacity",
+            "edge_datarate_fraction",
+        ]
+    ]
+    feature_list = FeatureList(features)
+    idx = embedding.enode_indices()
+    edges = embedding.edge_arrays()
+
+    shared = SharedValues(embedding)
+    nodes = feature_list.extract_nodes(embedding, idx, shared)
+    assert nodes.shape == (len(idx), feature_list.node_dim)
+    assert_rows_equal(
+        nodes,
+        np.hstack(
+            [feature.process_nodes(embedding, idx) for feature in features]
+        ),
+    )
+
+    del calls[:]
+    block = feature_list.extract_edges(embedding, *edges, shared)
+    assert len(calls) == 1
+    assert block.shape == (len(edges[0]), feature_list.edge_dim)
+    assert_rows_equal(
+        block,
+        np.hstack(
+            [feature.process_edges(embedding, *edges) for feature in features]
+        ),
+    )
@@ -12,7 +12,7 @@ from scipy import stats
 import networkx as nx
 
 from overlay import OverlayNetwork
-from infrastructure import InfrastructureNetwork
+from infrastructure import InfrastructureNetwork, NodeKind
 from embedding import PartialEmbedding
 import baseline_agent
 from hyperparameters import GENERATOR_DEFAULTS
@@ -108,23 +108,28 @@ class Generator:
         """Generates a randomized infrastructure"""
         assert num_sources > 0
 
-        infra = InfrastructureNetwork()
+        kinds = []
+        positions = []
+        powers = []
+        capacities = []
 
-        rand_node_args = lambda: {
-            "pos": self.pos_dist(rand),
-            "transmit_power_dbm": self.power_dist(rand),
-            "capacity": self.capacity_dist(rand),
-        }
+        def add_random_node(kind):
+            kinds.append(kind)
+            positions.append(self.pos_dist(rand))
+            powers.append(self.power_dist(rand))
+            capacities.append(self.capacity_dist(rand))
 
-        infra.set_sink(**rand_node_args())
+        add_random_node(NodeKind.sink)
 
         for _ in range(num_sources):
-            infra.add_source(**rand_node_args())
+            add_random_node(NodeKind.source)
 
         for _ in range(self.interm_nodes_dist(rand)):
-            infra.add_intermediate(**rand_node_args())
+            add_random_node(NodeKind.intermediate)
 
-        return infra
+        return InfrastructureNetwork.from_arrays(
+            positions, powers, capacities, kinds
+        )
 
     def random_overlay(self, num_sources: int, rand):
         """Generates a randomized overlay graph"""
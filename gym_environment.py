@@ -6,7 +6,7 @@ import gym
 from graph_nets import utils_np, utils_tf
 from graph_nets.graphs import GraphsTuple
 
-from observation import ObservationBuilder, TIMESLOT_IDX, POSSIBLE_IDX
+from observation import IncrementalObservationBuilder
 
 
 class GraphSpace(gym.spaces.Space):
@@ -82,6 +82,9 @@ class WSNEnvironment(gym.Env):
     ):
         self.problem_generator = problem_generator
         self._features = features
+        # keeps the features of the last observation around to only
+        # update them after each step
+        self._observation_builder = IncrementalObservationBuilder(features)
         self._additional_timeslot_reward = additional_timeslot_reward
         self._restart_reward = restart_reward
         self._succssess_reward = success_reward
@@ -97,27 +100,11 @@ class WSNEnvironment(gym.Env):
         self.early_exit_factor = early_exit_factor
 
     def _get_observation(self):
-        graph = ObservationBuilder(features=self._features).get_observation(
-            self.env
-        )
-
-        gt = utils_np.networkxs_to_graphs_tuple([graph])
-
-        # build action indices here to make sure the indices matches the
-        # one the network is seeing
-        self.actions = []
-        edges = gt.edges if gt.edges is not None else []  # may be None
-        for (u, v, d) in zip(gt.senders, gt.receivers, edges):
-            possible = d[POSSIBLE_IDX] == 1
-            if not possible:
-                continue
-            else:
-                source = graph.node[u]["represents"]
-                target = graph.node[v]["represents"]
-                timeslot = int(d[TIMESLOT_IDX])
-                self.actions.append((source, target, timeslot))
-
-        return gt
+        # the action indices are built together with the arrays to make
+        # sure they match the ones the network is seeing
+        builder = self._observation_builder
+        (arrays, self.actions) = builder.get_observation_arrays(self.env)
+        return GraphsTuple(**arrays)
 
     def step(self, action):
         (source, sink, timeslot) = self.actions[action]
@@ -137,7 +124,7 @@ class WSNEnvironment(gym.Env):
         nodes = len(self.env.infra.nodes())
         bl = self.baseline
 
-        if not done and len(self.env.possibilities()) == 0:
+        if not done and self.env.num_possibilities() == 0:
             # Avoid getting stuck on difficult/impossible problems,
             # especially in the beginning. It is important not to do
             # this too early, since otherwise the agent could learn to
@@ -148,7 +135,7 @@ class WSNEnvironment(gym.Env):
             if self.total_reward < min_reward:
                 print("Early exit")
                 done = True
-        if not done and len(self.env.possibilities()) == 0:
+        if not done and self.env.num_possibilities() == 0:
             # Failed to solve the problem, retry without ending the
             # episode (thus penalizing the failed attempt).
             embedded_links = len(self.env.finished_embeddings)
@@ -1,10 +1,13 @@
 """Modelling the physical network"""
 
-from typing import FrozenSet
+from typing import FrozenSet, Iterable
+from collections import OrderedDict, namedtuple
 from functools import lru_cache
 from enum import Enum
 from math import inf
+import weakref
 import numpy as np
+from scipy.spatial import cKDTree
 import networkx as nx
 import wsignal
 
@@ -17,14 +20,110 @@ class NodeKind(Enum):
     intermediate = 3
 
 
+CacheInfo = namedtuple(
+    "CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"]
+)
+
+
+class Cache:
+    """Memoizes a function by its (hashable) arguments.
+
+    Unlike lru_cache the eviction policy can be chosen ("lru" evicts
+    the least recently used entry, "fifo" the oldest one) and evictions
+    are counted, so that the cache behaviour can be observed and
+    tuned. A maxsize of None means the cache is unbounded.
+    """
+
+    def __init__(self, function, maxsize=None, policy="lru"):
+        if policy not in ("lru", "fifo"):
+            raise ValueError(f"Unknown eviction policy {policy}")
+        self._function = function
+        self._entries = OrderedDict()
+        self.maxsize = maxsize
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, *args):
+        try:
+            value = self._entries[args]
+        except KeyError:
+            self.misses += 1
+            value = self._function(*args)
+            if self.maxsize is not None and self.maxsize <= 0:
+                return value
+            if self.maxsize is not None and len(self._entries) >= self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[args] = value
+            return value
+        self.hits += 1
+        if self.policy == "lru":
+            self._entries.move_to_end(args)
+        return value
+
+    def cache_info(self):
+        """Returns the hit, miss and eviction counters"""
+        return CacheInfo(
+            self.hits,
+            self.misses,
+            self.evictions,
+            self.maxsize,
+            len(self._entries),
+        )
+
+    def invalidate(self, predicate):
+        """Drops all entries whose arguments match a predicate"""
+        stale = [args for args in self._entries if predicate(*args)]
+        for args in stale:
+            del self._entries[args]
+        return len(stale)
+
+    def cache_clear(self):
+        """Empties the cache and resets the counters"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+def _set_bits(mask: int):
+    """Indices of the bits set in an integer bitmask"""
+    indices = []
+    while mask:
+        lowest = mask & -mask
+        indices.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return indices
+
+
 class InfrastructureNetwork:
     """Model of the physical network"""
 
-    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
     # Instance attributes needed for caching, I think private instance
     # attributes are fine.
 
-    def __init__(self, bandwidth=1, noise_floor_dbm: float = -30):
+    # tables derived from the nodes, built on demand and never pickled
+    _DERIVED_TABLES = (
+        "_node_index",
+        "_received_dbm",
+        "_received_watt",
+        "_capacity_alone",
+        "_interference_watt",
+        "_interferer_masks",
+        "_spatial_index",
+    )
+
+    def __init__(
+        self,
+        bandwidth=1,
+        noise_floor_dbm: float = -30,
+        sinr_cache_size: int = None,
+        sinr_cache_policy: str = "lru",
+        interference_cutoff: float = None,
+    ):
         self._last_id = 0
         # Link capacity is influenced by the SINR and the bandwidth.
         # Leaving the bandwidth set to 1 will result in a link capacity
@@ -34,6 +133,20 @@ class InfrastructureNetwork:
         self.bandwidth = bandwidth
         # https://www.quora.com/How-high-is-the-ambient-RF-noise-floor-in-the-2-4-GHz-spectrum-in-downtown-San-Francisco
         self.noise_floor_dbm = noise_floor_dbm
+        # None sizes the SINR cache based on the number of nodes
+        self.sinr_cache_size = sinr_cache_size
+        self.sinr_cache_policy = sinr_cache_policy
+        # Senders whose power at a node is below this fraction of the
+        # noise floor are not counted as interference there. None means
+        # all interference is taken into account.
+        self.interference_cutoff = interference_cutoff
+        # Linear gain from the row node to the column node (in insertion
+        # order) if supplied from outside, for example measured. The log
+        # path loss model is used to derive it from the positions
+        # otherwise.
+        self._link_gains = None
+        # embeddings etc. that are notified of changes, see `subscribe`
+        self._observers = weakref.WeakSet()
 
         self.graph = nx.Graph()
 
@@ -42,21 +155,30 @@ class InfrastructureNetwork:
         self.intermediates = set()
 
         # transparent caching per instance
-        self.power_at_node = self._power_at_node
-        self.sinr = lru_cache(1)(self._sinr)
         self.power_at_node = lru_cache(1)(self._power_at_node)
-        self.power_received_dbm = lru_cache(None)(self._power_received_dbm)
+        self.masked_sinr = Cache(self._masked_sinr, 1, sinr_cache_policy)
+        # received power between all pairs of nodes and so on, see
+        # _DERIVED_TABLES
+        self._node_index = None
+        self._received_dbm = None
+        self._received_watt = None
+        self._capacity_alone = None
+        self._interference_watt = None
+        self._interferer_masks = None
+        self._spatial_index = None
 
     def _reset_caches(self):
         nodes = len(self.nodes())
 
-        if hasattr(self, "sinr"):
-            self.sinr.cache_clear()
-        # Enough space for all pairwise SINRs for 20 different
-        # configurations of sending nodes. Most relevant is the "no
-        # sending nodes" case, which will happen all the time.
-        sinr_maxsize = min(20 * nodes ** 2, 10 * 1024)  # upper bound
-        self.sinr = lru_cache(maxsize=sinr_maxsize)(self._sinr)
+        sinr_maxsize = self.sinr_cache_size
+        if sinr_maxsize is None:
+            # Enough space for all pairwise SINRs for 20 different
+            # configurations of sending nodes. Most relevant is the "no
+            # sending nodes" case, which will happen all the time.
+            sinr_maxsize = min(20 * nodes ** 2, 10 * 1024)  # upper bound
+        self.masked_sinr = Cache(
+            self._masked_sinr, sinr_maxsize, self.sinr_cache_policy
+        )
 
         if hasattr(self, "power_at_node"):
             self.power_at_node.cache_clear()
@@ -64,24 +186,73 @@ class InfrastructureNetwork:
             self._power_at_node
         )
 
-        if hasattr(self, "power_received_dbm"):
-            self.power_received_dbm.cache_clear()
-        self.power_received_dbm = lru_cache(maxsize=nodes)(
-            self._power_received_dbm
-        )
+        for table in self._DERIVED_TABLES:
+            setattr(self, table, None)
 
     def __getstate__(self):
         state = self.__dict__.copy()
         # don't pickle caches
-        del state["sinr"]
+        del state["masked_sinr"]
         del state["power_at_node"]
-        del state["power_received_dbm"]
+        # observers subscribe again when they are restored
+        del state["_observers"]
+        for table in self._DERIVED_TABLES:
+            del state[table]
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        self._observers = weakref.WeakSet()
         self._reset_caches()
 
+    @classmethod
+    def from_arrays(
+        # pylint: disable=too-many-arguments
+        cls,
+        positions,
+        powers,
+        capacities,
+        kinds,
+        names=None,
+        link_gains=None,
+        **kwargs,
+    ):
+        """Builds a whole infrastructure at once.
+
+        The i-th node is placed at positions[i], sends with powers[i] and
+        has the capacity and NodeKind at index i. Names are generated if
+        they are not given. Other keyword arguments are passed to the
+        constructor. This is much cheaper than adding the nodes one by
+        one, since the caches are only set up once.
+
+        If `link_gains` is given, link_gains[i][j] is the linear gain
+        (attenuation) from node i to node j, which is then used instead of
+        the path loss model. The diagonal is ignored. No nodes can be
+        added to such an infrastructure later on.
+        """
+        # the new instance is of this class, so it's not really a client
+        # pylint: disable=protected-access
+        infra = cls(**kwargs)
+        if names is None:
+            names = [None] * len(kinds)
+        columns = (positions, powers, capacities, kinds, names)
+        if len({len(column) for column in columns}) > 1:
+            raise ValueError("All node attributes need the same length")
+        for (pos, power, capacity, kind, name) in zip(
+            positions, powers, capacities, kinds, names
+        ):
+            infra._insert_node(pos, power, NodeKind(kind), capacity, name)
+        if link_gains is not None:
+            gains = np.array(link_gains, dtype=float)
+            if gains.shape != (len(kinds), len(kinds)):
+                raise ValueError("Link gains need to be a square matrix")
+            # each node receives infinite power from itself, just like
+            # with the path loss model
+            np.fill_diagonal(gains, inf)
+            infra._link_gains = gains
+        infra._reset_caches()
+        return infra
+
     def nodes(self):
         """Returns all infrastructure nodes"""
         return self.graph.nodes()
@@ -97,7 +268,6 @@ class InfrastructureNetwork:
         node = self._add_node(
             pos, transmit_power_dbm, NodeKind.intermediate, capacity, name
         )
-        self.intermediates.add(node)
         return node
 
     def add_source(
@@ -111,7 +281,6 @@ class InfrastructureNetwork:
         node = self._add_node(
             pos, transmit_power_dbm, NodeKind.source, capacity, name
         )
-        self.sources.add(node)
         return node
 
     def set_sink(
@@ -125,7 +294,6 @@ class InfrastructureNetwork:
         node = self._add_node(
             pos, transmit_power_dbm, NodeKind.sink, capacity, name
         )
-        self.sink = node
         return node
 
     def _add_node(
@@ -136,6 +304,21 @@ class InfrastructureNetwork:
         capacity: float,
         name: str = None,
     ):
+        name = self._insert_node(pos, transmit_power_dbm, kind, capacity, name)
+        self._reset_caches()
+        return name
+
+    def _insert_node(
+        self,
+        pos: (float, float),
+        transmit_power_dbm: float,
+        kind: NodeKind,
+        capacity: float,
+        name: str = None,
+    ):
+        """Adds a node without touching the caches"""
+        if self._link_gains is not None:
+            raise ValueError("Link gains are only known for existing nodes")
         if name is None:
             name = self._generate_name()
 
@@ -146,9 +329,95 @@ class InfrastructureNetwork:
             capacity=capacity,
             transmit_power_dbm=transmit_power_dbm,
         )
-        self._reset_caches()
+        if kind == NodeKind.source:
+            self.sources.add(name)
+        elif kind == NodeKind.intermediate:
+            self.intermediates.add(name)
+        else:
+            self.sink = name
         return name
 
+    def subscribe(self, observer):
+        """Registers an observer to be notified of changes to existing
+        nodes. It needs to provide
+
+        - `infrastructure_changed(node)`, called after a node was moved
+          or its transmit power was changed,
+        - `check_node_removable(node)`, called before a node is removed
+          and raising a ValueError to prevent it and
+        - `infrastructure_node_removed(node, index)`, called after a
+          node (previously at the given index) was removed.
+
+        Observers are only weakly referenced."""
+        self._observers.add(observer)
+
+    def move_node(self, node, pos: (float, float)):
+        """Moves a node to a new position"""
+        self.graph.nodes[node]["pos"] = pos
+        self._spatial_index = None
+        if self._link_gains is None:
+            self._node_changed(node)
+
+    def set_power(self, node, transmit_power_dbm: float):
+        """Changes the transmit power of a node"""
+        self.graph.nodes[node]["transmit_power_dbm"] = transmit_power_dbm
+        self._node_changed(node)
+
+    def _node_changed(self, node):
+        """Updates everything derived from the signal of a node that
+        has moved or changed its transmit power"""
+        if self._node_index is not None:
+            self._update_power_entries(self._node_index[node])
+            bit = 1 << self._node_index[node]
+            self.masked_sinr.invalidate(
+                lambda source, target, mask: node in (source, target)
+                or mask & bit
+            )
+        self.power_at_node.cache_clear()
+        for observer in list(self._observers):
+            observer.infrastructure_changed(node)
+
+    def remove_node(self, node):
+        """Removes a node, as long as no observer objects"""
+        for observer in list(self._observers):
+            observer.check_node_removable(node)
+        index = list(self.nodes()).index(node)
+
+        self.graph.remove_node(node)
+        self.sources.discard(node)
+        self.intermediates.discard(node)
+        if self.sink == node:
+            self.sink = None
+
+        if self._link_gains is not None:
+            self._link_gains = self._without_node(self._link_gains, index)
+        if self._node_index is not None:
+            self._node_index = {
+                node: i for (i, node) in enumerate(self.nodes())
+            }
+            self._received_dbm = self._without_node(self._received_dbm, index)
+            self._received_watt = self._without_node(
+                self._received_watt, index
+            )
+            if self._capacity_alone is not None:
+                self._capacity_alone = self._without_node(
+                    self._capacity_alone, index
+                )
+        # these are cheap to rebuild from the power matrices
+        self._interference_watt = None
+        self._interferer_masks = None
+        self._spatial_index = None
+        # the sender masks of all following nodes have changed
+        self.masked_sinr.cache_clear()
+        self.power_at_node.cache_clear()
+
+        for observer in list(self._observers):
+            observer.infrastructure_node_removed(node, index)
+
+    @staticmethod
+    def _without_node(matrix, index):
+        return np.delete(np.delete(matrix, index, axis=0), index, axis=1)
+
     def capacity(self, node):
         """Returns the capacity of a given node"""
         return self.graph.node[node]["capacity"]
@@ -163,48 +432,267 @@ class InfrastructureNetwork:
 
     def min_node_distance(self):
         """Calculates the distance between the closest nodes"""
-        min_distance = inf
-        for a in self.nodes():
-            x1, y1 = self.position(a)
-            for b in self.nodes():
-                if b == a:
-                    continue
-                x2, y2 = self.position(b)
-                dist = wsignal.distance(x1, y1, x2, y2)
-                if dist < min_distance:
-                    min_distance = dist
-        return min_distance
-
-    def _power_received_dbm(self, source, target):
+        pair = self.min_pair_distance()
+        if pair is None:
+            return inf
+        (a, b) = pair
+        return wsignal.distance(*self.position(a), *self.position(b))
+
+    def _spatial_tree(self):
+        """k-d tree over the node positions and the nodes in the order
+        of the tree's data. Does not need the power matrices."""
+        if self._spatial_index is None:
+            nodes = list(self.nodes())
+            positions = np.array(
+                [self.position(node) for node in nodes], dtype=float
+            ).reshape(-1, 2)
+            self._spatial_index = (cKDTree(positions), nodes)
+        return self._spatial_index
+
+    def nearest(self, pos: (float, float), k: int = 1):
+        """The k nodes closest to a position, closest first"""
+        (tree, nodes) = self._spatial_tree()
+        k = min(k, len(nodes))
+        if k <= 0:
+            return []
+        (_distances, indices) = tree.query(pos, k=[i + 1 for i in range(k)])
+        return [nodes[i] for i in indices]
+
+    def within_radius(self, pos: (float, float), radius: float):
+        """All nodes that are at most `radius` away from a position"""
+        (tree, nodes) = self._spatial_tree()
+        return {nodes[i] for i in tree.query_ball_point(pos, radius)}
+
+    def min_pair_distance(self):
+        """The two nodes that are closest to each other, or None if there
+        are less than two nodes"""
+        (tree, nodes) = self._spatial_tree()
+        if len(nodes) < 2:
+            return None
+        # the two closest nodes to each node, one of which is itself
+        # (unless another node shares its position)
+        (distances, indices) = tree.query(tree.data, k=2)
+        closest = int(np.argmin(distances[:, 1]))
+        (first, second) = indices[closest]
+        other = second if first == closest else first
+        return (nodes[closest], nodes[other])
+
+    def node_index(self):
+        """Maps every node to its row and column in the power matrices"""
+        if self._node_index is None:
+            self._build_power_matrices()
+        return self._node_index
+
+    def power_received_dbm_matrix(self):
+        """Power received (dBm) at the column node if the row node sends
+        at full power, for all pairs of nodes"""
+        if self._received_dbm is None:
+            self._build_power_matrices()
+        return self._received_dbm
+
+    def power_received_watt_matrix(self):
+        """Like `power_received_dbm_matrix`, but in watts"""
+        if self._received_watt is None:
+            self._build_power_matrices()
+        return self._received_watt
+
+    def interference_watt_matrix(self):
+        """Like `power_received_watt_matrix`, but with the power that is
+        below the interference cut-off set to 0"""
+        if self._interference_watt is None:
+            self._build_interference_tables()
+        return self._interference_watt
+
+    def interferers(self, node):
+        """The nodes whose sending counts as interference at a node"""
+        if self._interferer_masks is None:
+            self._build_interference_tables()
+        nodes = list(self.node_index())
+        mask = self._interferer_masks[self.node_index()[node]]
+        return {nodes[i] for i in _set_bits(mask)}
+
+    def interference_error_bound_db(self):
+        """Upper bound on how much any SINR may be overestimated because
+        of the interference cut-off, in dB"""
+        received = self.power_received_watt_matrix()
+        with np.errstate(invalid="ignore"):
+            ignored = received - self.interference_watt_matrix()
+        # nodes receiving infinite power have nothing ignored
+        ignored[np.isnan(ignored)] = 0
+        if ignored.size == 0:
+            return 0.0
+        noise = wsignal.dbm_to_watt(self.noise_floor_dbm)
+        # worst case is no other interference and every ignored node
+        # sending at once
+        worst = float(ignored.sum(axis=0).max())
+        return float(10 * np.log10(1 + worst / noise))
+
+    def _build_interference_tables(self):
+        received = self.power_received_watt_matrix()
+        nodes = len(received)
+        if self.interference_cutoff is None:
+            self._interference_watt = received
+            self._interferer_masks = [(1 << nodes) - 1] * nodes
+            return
+        relevant = self._relevant_interference(received)
+        self._interference_watt = np.where(relevant, received, 0.0)
+        # sparse neighbour lists (as bitmasks) of the relevant senders
+        # for every receiving node
+        self._interferer_masks = [
+            sum(1 << int(i) for i in np.flatnonzero(relevant[:, j]))
+            for j in range(nodes)
+        ]
+
+    def _relevant_interference(self, received_watt):
+        noise = wsignal.dbm_to_watt(self.noise_floor_dbm)
+        return received_watt >= self.interference_cutoff * noise
+
+    def interference_free_capacity_matrix(self):
+        """Capacity of the link from the row node to the column node if
+        nothing else is sending. Interference can only lower it, so this
+        is an upper bound for all timeslots."""
+        if self._capacity_alone is None:
+            self._capacity_alone = self._capacity_without_interference(
+                self.power_received_dbm_matrix()
+            )
+        return self._capacity_alone
+
+    def _capacity_without_interference(self, received_dbm):
+        sinr = wsignal.sinr_array(received_dbm, -inf, self.noise_floor_dbm)
+        return wsignal.shannon_capacity_array(self.bandwidth, sinr)
+
+    def _build_power_matrices(self):
+        nodes = list(self.nodes())
+        self._node_index = {node: i for (i, node) in enumerate(nodes)}
+        everything = np.arange(len(nodes))
+        (self._received_dbm, self._received_watt) = self._received_power(
+            everything, everything
+        )
+
+    def _received_power(self, senders, receivers):
+        """Power (dBm, watts) received at every receiving node if the
+        sending node sends at full power, for arrays of node indices"""
+        nodes = list(self._node_index)
+        transmit_power_dbm = np.array(
+            [self.power(node) for node in nodes], dtype=float
+        )[senders, np.newaxis]
+        if self._link_gains is not None:
+            transmit_power_watt = wsignal.dbm_to_watt_array(transmit_power_dbm)
+            gains = self._link_gains[np.ix_(senders, receivers)]
+            received_watt = transmit_power_watt * gains
+            return (wsignal.watt_to_dbm_array(received_watt), received_watt)
+
+        positions = np.array(
+            [self.position(node) for node in nodes], dtype=float
+        ).reshape(-1, 2)
+        (x, y) = (positions[:, 0], positions[:, 1])
+        distance = wsignal.distance_array(
+            x[senders, np.newaxis],
+            y[senders, np.newaxis],
+            x[receivers],
+            y[receivers],
+        )
+        # log(0) is taken to be -inf, so each node receives infinite
+        # power from itself
+        received_dbm = wsignal.power_received_array(
+            distance, transmit_power_dbm
+        )
+        return (received_dbm, wsignal.dbm_to_watt_array(received_dbm))
+
+    def _update_power_entries(self, index):
+        """Recomputes the rows and columns of the derived tables that
+        belong to the node with the given index. The tables are replaced,
+        not modified, so that they can safely be shared."""
+        everything = np.arange(len(self._node_index))
+        (row_dbm, row_watt) = self._received_power([index], everything)
+        (col_dbm, col_watt) = self._received_power(everything, [index])
+
+        def with_entries(matrix, row, col):
+            matrix = matrix.copy()
+            matrix[index, :] = row[0, :]
+            matrix[:, index] = col[:, 0]
+            return matrix
+
+        self._received_dbm = with_entries(self._received_dbm, row_dbm, col_dbm)
+        self._received_watt = with_entries(
+            self._received_watt, row_watt, col_watt
+        )
+        if self._capacity_alone is not None:
+            self._capacity_alone = with_entries(
+                self._capacity_alone,
+                self._capacity_without_interference(row_dbm),
+                self._capacity_without_interference(col_dbm),
+            )
+        if self.interference_cutoff is None:
+            if self._interference_watt is not None:
+                self._interference_watt = self._received_watt
+        elif self._interference_watt is not None:
+            row_relevant = self._relevant_interference(row_watt)
+            col_relevant = self._relevant_interference(col_watt)
+            self._interference_watt = with_entries(
+                self._interference_watt,
+                np.where(row_relevant, row_watt, 0.0),
+                np.where(col_relevant, col_watt, 0.0),
+            )
+            masks = list(self._interferer_masks)
+            bit = 1 << index
+            for (receiver, relevant) in enumerate(row_relevant[0, :]):
+                if relevant:
+                    masks[receiver] |= bit
+                else:
+                    masks[receiver] &= ~bit
+            masks[index] = sum(
+                1 << int(i) for i in np.flatnonzero(col_relevant[:, 0])
+            )
+            self._interferer_masks = masks
+
+    def power_received_dbm(self, source, target):
         """Power received at sink if source sends at full power"""
-        source_node = self.graph.nodes[source]
-        target_node = self.graph.nodes[target]
-        src_x, src_y = source_node["pos"]
-        trg_x, trg_y = target_node["pos"]
-        distance = wsignal.distance(src_x, src_y, trg_x, trg_y)
-        transmit_power_dbm = source_node["transmit_power_dbm"]
-        return wsignal.power_received(distance, transmit_power_dbm)
+        index = self.node_index()
+        matrix = self.power_received_dbm_matrix()
+        return float(matrix[index[source], index[target]])
+
+    def sender_mask(self, senders: Iterable[str]):
+        """Represents a set of nodes as an integer bitmask over their
+        indices"""
+        index = self.node_index()
+        mask = 0
+        for sender in senders:
+            mask |= 1 << index[sender]
+        return mask
 
     def _power_at_node(self, node: str, senders: FrozenSet[str]):
         """Calculates the amount of power a node receives (signal+noise)
         assuming only `senders` sends"""
+        mask = self.sender_mask(senders)
+        return self._masked_power_at_node(self.node_index()[node], mask)
+
+    def _masked_power_at_node(self, node_idx: int, mask: int):
+        if self.interference_cutoff is not None:
+            if self._interferer_masks is None:
+                self._build_interference_tables()
+            mask &= self._interferer_masks[node_idx]
         # We need to convert to watts for addition (log scale can only
         # multiply)
-        received_power_watt = 0
-        for sender in senders:
-            p_r = self.power_received_dbm(sender, node)
-            received_power_watt += wsignal.dbm_to_watt(p_r)
+        column = self.power_received_watt_matrix()[:, node_idx]
+        received_power_watt = float(column[_set_bits(mask)].sum())
 
         return wsignal.watt_to_dbm(received_power_watt)
 
-    def _sinr(self, source: str, target: str, senders: FrozenSet[str]):
+    def sinr(self, source: str, target: str, senders: FrozenSet[str]):
         """
         SINR assuming only `senders` are sending.
         """
+        return self.masked_sinr(source, target, self.sender_mask(senders))
+
+    def _masked_sinr(self, source: str, target: str, mask: int):
+        """SINR assuming only the nodes in the bitmask are sending"""
         received_signal_dbm = self.power_received_dbm(source, target)
 
         # everything already sending is assumed to be interference
-        received_interference_dbm = self.power_at_node(target, senders=senders)
+        received_interference_dbm = self._masked_power_at_node(
+            self.node_index()[target], mask
+        )
 
         return wsignal.sinr(
             received_signal_dbm,
@@ -0,0 +1,236 @@
+"""Tests the infrastructure model"""
+
+import pickle
+import pytest
+from pytest import approx
+import wsignal
+from infrastructure import InfrastructureNetwork, NodeKind, Cache
+
+
+def test_cache_eviction_policies():
+    """Tests that the cache evicts according to its policy and counts
+    hits, misses and evictions"""
+    calls = []
+
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    lru = Cache(square, maxsize=2, policy="lru")
+    fifo = Cache(square, maxsize=2, policy="fifo")
+    for cache in (lru, fifo):
+        assert cache(1) == 1
+        assert cache(2) == 4
+        # touch 1, which only keeps it alive for lru
+        assert cache(1) == 1
+        assert cache(3) == 9
+
+    del calls[:]
+    assert lru(1) == 1
+    assert fifo(1) == 1
+    assert calls == [1]
+
+    assert lru.cache_info() == (2, 3, 1, 2, 2)
+    assert fifo.cache_info() == (1, 4, 2, 2, 2)
+
+    lru.cache_clear()
+    assert lru.cache_info() == (0, 0, 0, 2, 0)
+
+
+def test_sinr_is_cached_by_sender_mask():
+    """Tests that SINRs with the same senders share cache entries"""
+    infra = InfrastructureNetwork(sinr_cache_size=10, sinr_cache_policy="fifo")
+    n1 = infra.add_source(pos=(0, 0), transmit_power_dbm=30)
+    n2 = infra.add_intermediate(pos=(1, 0), transmit_power_dbm=30)
+    n3 = infra.add_intermediate(pos=(0, 1), transmit_power_dbm=30)
+    n4 = infra.set_sink(pos=(1, 1), transmit_power_dbm=30)
+
+    with_interference = infra.sinr(n1, n4, frozenset([n2, n3]))
+    assert with_interference < infra.sinr(n1, n4, frozenset())
+
+    mask = infra.sender_mask([n3, n2])
+    assert infra.masked_sinr(n1, n4, mask) == with_interference
+    info = infra.masked_sinr.cache_info()
+    assert (info.hits, info.misses, info.maxsize) == (1, 2, 10)
+
+
+def test_from_arrays_matches_incremental_construction():
+    """Tests that building an infrastructure at once is equivalent to
+    adding the nodes one by one"""
+    incremental = InfrastructureNetwork(noise_floor_dbm=-20)
+    n1 = incremental.add_source(pos=(0, 0), transmit_power_dbm=30)
+    n2 = incremental.add_intermediate(
+        pos=(3, 1), transmit_power_dbm=20, capacity=5
+    )
+    n3 = incremental.set_sink(pos=(2, 2), transmit_power_dbm=25)
+
+    bulk = InfrastructureNetwork.from_arrays(
+        positions=[(0, 0), (3, 1), (2, 2)],
+        powers=[30, 20, 25],
+        capacities=[float("inf"), 5, float("inf")],
+        kinds=[NodeKind.source, NodeKind.intermediate, NodeKind.sink],
+        noise_floor_dbm=-20,
+    )
+
+    assert list(bulk.graph.nodes(data=True)) == list(
+        incremental.graph.nodes(data=True)
+    )
+    assert bulk.sources == {n1}
+    assert bulk.intermediates == {n2}
+    assert bulk.sink == n3
+    assert bulk.sinr(n1, n3, frozenset([n2])) == incremental.sinr(
+        n1, n3, frozenset([n2])
+    )
+
+
+def test_interference_free_capacity_matrix():
+    """Tests that the capacity table agrees with the SINR without any
+    other senders"""
+    infra = InfrastructureNetwork(bandwidth=2)
+    n1 = infra.add_source(pos=(0, 0), transmit_power_dbm=30)
+    n2 = infra.add_intermediate(pos=(5, 0), transmit_power_dbm=20)
+    n3 = infra.set_sink(pos=(50, 50), transmit_power_dbm=25)
+
+    matrix = infra.interference_free_capacity_matrix()
+    index = infra.node_index()
+    for u in (n1, n2, n3):
+        for v in (n1, n2, n3):
+            if u == v:
+                continue
+            sinr = infra.sinr(u, v, frozenset())
+            expected = wsignal.shannon_capacity(infra.bandwidth, sinr)
+            assert matrix[index[u], index[v]] == approx(expected)
+    assert matrix[index[n1], index[n2]] > matrix[index[n1], index[n3]]
+
+
+def test_interference_cutoff():
+    """Tests that far away senders are ignored as interference and that
+    the reported error bound holds"""
+    exact = InfrastructureNetwork()
+    approximate = InfrastructureNetwork(interference_cutoff=0.5)
+    for infra in (exact, approximate):
+        infra.add_source(name="n1", pos=(0, 0), transmit_power_dbm=30)
+        infra.add_intermediate(name="n2", pos=(2, 0), transmit_power_dbm=30)
+        infra.add_intermediate(name="n3", pos=(3, 0), transmit_power_dbm=30)
+        infra.add_intermediate(name="far", pos=(60, 0), transmit_power_dbm=0)
+        infra.set_sink(name="n4", pos=(1, 0), transmit_power_dbm=30)
+
+    assert exact.interference_error_bound_db() == 0
+    assert exact.interferers("n4") == {"n1", "n2", "n3", "far", "n4"}
+    assert approximate.interferers("n4") == {"n1", "n2", "n3", "n4"}
+
+    senders = frozenset(["n3", "far"])
+    assert approximate.sinr("n2", "n4", senders) == approximate.sinr(
+        "n2", "n4", frozenset(["n3"])
+    )
+    error = approximate.sinr("n2", "n4", senders) - exact.sinr(
+        "n2", "n4", senders
+    )
+    assert 0 < error <= approximate.interference_error_bound_db()
+
+
+def test_spatial_queries():
+    """Tests the neighbourhood and distance queries"""
+    infra = InfrastructureNetwork()
+    assert infra.min_pair_distance() is None
+    n1 = infra.add_source(pos=(0, 0), transmit_power_dbm=30)
+    assert infra.min_node_distance() == float("inf")
+    n2 = infra.add_intermediate(pos=(4, 3), transmit_power_dbm=30)
+    n3 = infra.add_intermediate(pos=(10, 0), transmit_power_dbm=30)
+    n4 = infra.set_sink(pos=(6, 3), transmit_power_dbm=30)
+
+    assert infra.nearest((5, 2.5)) == [n2]
+    assert infra.nearest((9, 1), k=2) == [n3, n4]
+    assert infra.nearest((0, 0), k=10) == [n1, n2, n4, n3]
+    assert infra.within_radius((0, 0), 5) == {n1, n2}
+    assert infra.within_radius((20, 20), 5) == set()
+    assert set(infra.min_pair_distance()) == {n2, n4}
+    assert infra.min_node_distance() == 2
+    # the queries do not need the power matrices
+    # pylint: disable=protected-access
+    assert infra._received_dbm is None
+
+    # nodes may share a position
+    n5 = infra.add_intermediate(pos=(10, 0), transmit_power_dbm=30)
+    assert set(infra.min_pair_distance()) == {n3, n5}
+    assert infra.min_node_distance() == 0
+
+
+def test_supplied_link_gains():
+    """Tests that supplied link gains replace the path loss model"""
+    infra = InfrastructureNetwork.from_arrays(
+        positions=[(0, 0), (1, 0), (2, 0)],
+        powers=[30, 20, 30],
+        capacities=[1, 1, 1],
+        kinds=[NodeKind.source, NodeKind.intermediate, NodeKind.sink],
+        names=["a", "b", "c"],
+        # positions don't matter for the signal anymore
+        link_gains=[[0, 1e-3, 1e-2], [1e-3, 0, 0], [1e-2, 1e-2, 0]],
+    )
+    assert infra.power_received_dbm("a", "b") == approx(0)
+    assert infra.power_received_dbm("b", "a") == approx(-10)
+    assert infra.power_received_dbm("a", "c") == approx(10)
+    assert infra.power_received_dbm("b", "c") == -float("inf")
+    assert infra.power_received_dbm("c", "c") == float("inf")
+
+    expected = wsignal.sinr(0, 10, infra.noise_floor_dbm)
+    assert infra.sinr("a", "b", frozenset(["c"])) == approx(expected)
+
+    restored = pickle.loads(pickle.dumps(infra))
+    assert restored.sinr("a", "b", frozenset(["c"])) == approx(expected)
+
+    with pytest.raises(ValueError):
+        infra.add_intermediate(pos=(3, 0), transmit_power_dbm=30)
+
+
+def test_node_updates_match_rebuild():
+    """Tests that moving, reconfiguring and removing nodes gives the
+    same results as building the changed infrastructure from scratch"""
+
+    def build(nodes, **kwargs):
+        infra = InfrastructureNetwork(**kwargs)
+        for (name, pos, power) in nodes:
+            if name == "sink":
+                infra.set_sink(name=name, pos=pos, transmit_power_dbm=power)
+            else:
+                infra.add_intermediate(
+                    name=name, pos=pos, transmit_power_dbm=power
+                )
+        return infra
+
+    nodes = [
+        ("n1", (0, 0), 30),
+        ("n2", (2, 0), 20),
+        ("n3", (5, 1), 30),
+        ("sink", (1, 3), 30),
+    ]
+    for cutoff in (None, 0.5):
+        infra = build(nodes, interference_cutoff=cutoff)
+        # fill the tables and the SINR cache
+        infra.interference_free_capacity_matrix()
+        infra.sinr("n3", "sink", frozenset(["n2"]))
+
+        infra.move_node("n2", (40, 0))
+        infra.set_power("n3", 10)
+        infra.remove_node("n1")
+        expected = build(
+            [("n2", (40, 0), 20), ("n3", (5, 1), 10), ("sink", (1, 3), 30)],
+            interference_cutoff=cutoff,
+        )
+
+        assert list(infra.node_index()) == list(expected.node_index())
+        for table in (
+            "power_received_dbm_matrix",
+            "power_received_watt_matrix",
+            "interference_watt_matrix",
+            "interference_free_capacity_matrix",
+        ):
+            actual = getattr(infra, table)()
+            assert actual.tolist() == getattr(expected, table)().tolist()
+        for node in infra.nodes():
+            assert infra.interferers(node) == expected.interferers(node)
+        senders = frozenset(["n2"])
+        assert infra.sinr("n3", "sink", senders) == expected.sinr(
+            "n3", "sink", senders
+        )
+        assert infra.nearest((39, 0)) == ["n2"]
@@ -6,7 +6,7 @@ import re
 import csv
 import numpy as np
 
-from infrastructure import InfrastructureNetwork
+from infrastructure import InfrastructureNetwork, NodeKind
 from overlay import OverlayNetwork
 from embedding import PartialEmbedding
 
@@ -48,14 +48,30 @@ def parse_overlay(blocks_file, links_file, datarate):
     return overlay
 
 
+def parse_attenuation(attenuation_file, names):
+    """Reads the linear gains between all pairs of nodes as a matrix in
+    the order of `names`. The shipped tables are rounded and differ from
+    the path loss derived from the positions by up to about 1.05e-8 dB."""
+    index = {name: i for (i, name) in enumerate(names)}
+    gains = np.zeros((len(names), len(names)))
+    for (_id, start, end, attenuation) in csv_to_list(attenuation_file):
+        gains[index[start], index[end]] = float(attenuation)
+    return gains
+
+
 def parse_infra(
+    # pylint: disable=too-many-arguments
     nodes_file,
     sink_source_mapping,
     positions_file,
     source_seed,
     transmit_power_dbm,
+    attenuation_file=None,
 ):
-    """Reads an infrastructure definition in MARVELO format from csvs"""
+    """Reads an infrastructure definition in MARVELO format from csvs.
+
+    The link gains are taken from the attenuation file if one is given
+    and derived from the positions otherwise."""
     # read the files
     names = []
     capacities = []
@@ -80,15 +96,23 @@ def parse_infra(
     specs[-1], specs[sink_idx] = specs[sink_idx], specs[-1]
 
     # construct the infrastructure from the gathered info
-    infra = InfrastructureNetwork(bandwidth=1, noise_floor_dbm=-30)
-    for (name, capacity, pos) in specs[:1]:
-        infra.add_source(pos, transmit_power_dbm, capacity, name)
-    for (name, capacity, pos) in specs[1:-1]:
-        infra.add_intermediate(pos, transmit_power_dbm, capacity, name)
-    for (name, capacity, pos) in specs[-1:]:
-        infra.set_sink(pos, transmit_power_dbm, capacity, name)
-
-    return infra
+    kinds = [NodeKind.intermediate] * len(specs)
+    kinds[0] = NodeKind.source
+    kinds[-1] = NodeKind.sink
+    (names, capacities, positions) = zip(*specs)
+    link_gains = None
+    if attenuation_file is not None:
+        link_gains = parse_attenuation(attenuation_file, names)
+    return InfrastructureNetwork.from_arrays(
+        positions,
+        [transmit_power_dbm] * len(specs),
+        capacities,
+        kinds,
+        names,
+        link_gains=link_gains,
+        bandwidth=1,
+        noise_floor_dbm=-30,
+    )
 
 
 # pylint: disable=too-many-arguments
@@ -101,6 +125,7 @@ def parse_embedding(
     links_file,
     transmit_power_dbm,
     datarate,
+    attenuation_file=None,
 ):
     """Reads a problem instance in MARVELO format from csv files"""
     infra = parse_infra(
@@ -109,6 +134,7 @@ def parse_embedding(
         positions_file,
         source_seed,
         transmit_power_dbm,
+        attenuation_file,
     )
     if infra is None:
         return None
@@ -157,7 +183,7 @@ def load_from_dir(basedir):
         info = (nodes, blocks, seed)
 
         nodes_file = f"{param_dir}/n{nodes}{seed}.csv"
-        # arcsfile = f'{param_dir}/a{nodes}{seed}.csv'
+        attenuation_file = f"{param_dir}/a{nodes}{seed}.csv"
         links_file = f"{param_dir}/chain_linear_{blocks}.csv"
         blocks_file = f"{param_dir}/b{blocks}{seed}.csv"
         positions_file = f"{param_dir}/pos{nodes}{seed}.csv"
@@ -171,6 +197,7 @@ def load_from_dir(basedir):
             links_file,
             transmit_power_dbm,
             datarate,
+            attenuation_file,
         )
         result.append((embedding, marvelo_result, info))
     return result
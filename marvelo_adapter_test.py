@@ -0,0 +1,39 @@
+"""Tests the import of MARVELO problems"""
+
+import os
+import glob
+import math
+from pytest import approx
+import wsignal
+from marvelo_adapter import csv_to_list, parse_attenuation
+
+PARAM_DIR = os.path.join(os.path.dirname(__file__), "marvelo_data", "param")
+
+
+def test_attenuation_matches_path_loss():
+    """Tests that the attenuation tables agree with the path loss derived
+    from the positions. The tables are rounded, so they only agree to
+    within about 1e-8 dB."""
+    attenuation_files = glob.glob(f"{PARAM_DIR}/a*.csv")
+    assert attenuation_files
+    for attenuation_file in attenuation_files:
+        instance = os.path.basename(attenuation_file)[1:]
+        nodes = csv_to_list(f"{PARAM_DIR}/n{instance}")
+        names = [name for (_id, name, _capacity) in nodes]
+        positions = [
+            [float(pos) for pos in csvline[1:]]
+            for csvline in csv_to_list(f"{PARAM_DIR}/pos{instance}", sep=";")
+        ]
+        # the file has one row per coordinate
+        positions = list(zip(*positions))
+        gains = parse_attenuation(attenuation_file, names)
+
+        for (i, (x1, y1)) in enumerate(positions):
+            for (j, (x2, y2)) in enumerate(positions):
+                if gains[i, j] == 0:
+                    continue
+                distance = wsignal.distance(x1, y1, x2, y2)
+                loss = wsignal.log_path_loss(distance)
+                assert -10 * math.log10(gains[i, j]) == approx(
+                    loss, abs=2e-8
+                )
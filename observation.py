@@ -1,9 +1,12 @@
 """Extract observations from embedding state"""
 
+from collections.abc import Sequence
+
 import networkx as nx
 import numpy as np
 
 from embedding import PartialEmbedding, ENode
+from features import SharedValues, FeatureList
 
 POSSIBLE_IDX = 0
 TIMESLOT_IDX = 1
@@ -21,6 +24,7 @@ class ObservationBuilder:
 
     def __init__(self, features):
         self._features = features
+        self._feature_list = FeatureList(features)
 
     def extract_node_features(self, embedding: PartialEmbedding, enode: ENode):
         """Build feature array for a single enode"""
@@ -37,10 +41,9 @@ class ObservationBuilder:
         timeslot: int,
     ):
         """Build feature array for a single edge"""
-        possible = (
-            not embedding.graph.edges[(source, target, timeslot)]["chosen"]
-            and embedding.graph.nodes[source]["chosen"]
-        )
+        possible = not embedding.is_edge_chosen(
+            source, target, timeslot
+        ) and embedding.is_chosen(source)
         features = [float(possible), float(timeslot)]
 
         for feature in self._features:
@@ -52,6 +55,34 @@ class ObservationBuilder:
         assert features[TIMESLOT_IDX] == float(timeslot)
         return features
 
+    def extract_node_feature_block(
+        self, embedding: PartialEmbedding, idx, shared=None
+    ):
+        """Build the feature arrays of many enodes (by index) at once"""
+        return self._feature_list.extract_nodes(embedding, idx, shared)
+
+    def extract_edge_feature_block(
+        # pylint: disable=too-many-arguments
+        self,
+        embedding: PartialEmbedding,
+        sources,
+        targets,
+        timeslots,
+        shared=None,
+    ):
+        """Build the feature arrays of many edges, given as arrays of
+        source and target enode indices and timeslots, at once"""
+        possible = ~embedding.is_edge_chosen_array(
+            sources, targets, timeslots
+        ) & (embedding.enode_chosen_array()[sources])
+        first = np.zeros((len(sources), 2))
+        first[:, POSSIBLE_IDX] = possible
+        first[:, TIMESLOT_IDX] = timeslots
+        rest = self._feature_list.extract_edges(
+            embedding, sources, targets, timeslots, shared
+        )
+        return np.hstack([first, rest])
+
     def get_observation(self, embedding: PartialEmbedding):
         """Extracts features from an embedding and returns a graph-nets
         compatible graph"""
@@ -60,26 +91,409 @@ class ObservationBuilder:
         # build graphs from scratch, since we need to change the node
         # indexing (graph_nets can only deal with integer indexed nodes)
         input_graph = nx.MultiDiGraph()
-        node_to_index = dict()
+        enodes = embedding.enode_table()
+        shared = SharedValues(embedding)
 
         # add the nodes
-        for (i, enode) in enumerate(embedding.graph.nodes()):
-            node_to_index[enode] = i
+        idx = embedding.enode_indices()
+        node_features = self.extract_node_feature_block(embedding, idx, shared)
+        node_to_index = dict()
+        for (i, (enode_idx, features)) in enumerate(zip(idx, node_features)):
+            node_to_index[enode_idx] = i
             input_graph.add_node(
-                i,
-                features=self.extract_node_features(embedding, enode),
-                represents=enode,
+                i, features=list(features), represents=enodes[enode_idx]
             )
 
         # add the edges
-        for (u, v, k) in embedding.graph.edges(keys=True):
+        (sources, targets, timeslots) = embedding.edge_arrays()
+        edge_features = self.extract_edge_feature_block(
+            embedding, sources, targets, timeslots, shared
+        )
+        for (u, v, k, features) in zip(
+            sources, targets, timeslots, edge_features
+        ):
             input_graph.add_edge(
                 node_to_index[u],
                 node_to_index[v],
-                k,
-                features=self.extract_edge_features(embedding, u, v, k),
+                int(k),
+                features=list(features),
             )
 
         # no globals in input
         input_graph.graph["features"] = np.array([0.0])
         return input_graph
+
+    def get_observation_arrays(self, embedding: PartialEmbedding):
+        """Extracts features from an embedding as the arrays of a
+        graph-nets graphs tuple (with a single graph). Returns them as a
+        dict together with the list of possible actions, which are
+        ordered like the possible edges."""
+        idx = embedding.enode_indices()
+        # enode index -> position in the node array
+        position = np.zeros(len(embedding.enode_table()), dtype=np.int32)
+        position[idx] = np.arange(len(idx), dtype=np.int32)
+
+        (sources, targets, timeslots) = embedding.edge_arrays()
+        shared = SharedValues(embedding)
+        nodes = self.extract_node_feature_block(embedding, idx, shared)
+        edges = self.extract_edge_feature_block(
+            embedding, sources, targets, timeslots, shared
+        )
+
+        enodes = embedding.enode_table()
+        actions = [
+            (enodes[sources[i]], enodes[targets[i]], int(timeslots[i]))
+            for i in np.flatnonzero(edges[:, POSSIBLE_IDX] == 1)
+        ]
+        arrays = {
+            "nodes": nodes,
+            "edges": edges,
+            "senders": position[sources],
+            "receivers": position[targets],
+            # no globals in input
+            "globals": np.zeros((1, 1)),
+            "n_node": np.array([len(idx)], dtype=np.int32),
+            "n_edge": np.array([len(sources)], dtype=np.int32),
+        }
+        return (arrays, actions)
+
+
+def _resized(table, length):
+    """Truncates a table or pads it with zeros to a number of rows"""
+    if len(table) >= length:
+        return table[:length]
+    padding = np.zeros((length - len(table),) + table.shape[1:], table.dtype)
+    return np.concatenate([table, padding])
+
+
+class _ActionList(Sequence):
+    """The possible actions of an observation, only translated to ENodes
+    when accessed"""
+
+    def __init__(self, enodes, sources, targets, timeslots):
+        self._enodes = enodes
+        self._sources = sources
+        self._targets = targets
+        self._timeslots = timeslots
+
+    def __len__(self):
+        return len(self._sources)
+
+    def __getitem__(self, i):
+        return (
+            self._enodes[self._sources[i]],
+            self._enodes[self._targets[i]],
+            int(self._timeslots[i]),
+        )
+
+
+class IncrementalObservationBuilder(ObservationBuilder):
+    """Builds the same observations as `get_observation_arrays` of an
+    ObservationBuilder, but keeps the features of the previous
+    observation and only recomputes those whose inputs are reported as
+    changed by the change log of the embedding. Only the order of the
+    edges in the open timeslot may differ."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, features):
+        super().__init__(features)
+        self._node_columns = self._columns("node_dim")
+        self._edge_columns = self._columns("edge_dim")
+        self._node_dim = self._feature_list.node_dim
+        self._edge_dim = self._feature_list.edge_dim
+        self._embedding = None
+        self._used_timeslots = None
+        # features of every enode and edge by index, including removed
+        # ones
+        self._node_rows = None
+        self._enode_node = None
+        self._edge_rows = None
+        self._edge_ends = None
+        # edges of the open timeslot, in slots that are reused once the
+        # edge is removed
+        self._open_slot = None
+        self._open_rows = None
+        self._open_ends = None
+        self._open_alive = np.zeros(0, dtype=bool)
+
+    def _columns(self, dim_attr):
+        """(feature, first column, last column) for every feature"""
+        columns = []
+        start = 0
+        for feature in self._features:
+            end = start + getattr(feature, dim_attr)
+            columns.append((feature, start, end))
+            start = end
+        return columns
+
+    def get_observation_arrays(self, embedding: PartialEmbedding):
+        changes = None
+        if embedding is self._embedding:
+            changes = embedding.pop_changes()
+        if changes is None or changes.infrastructure_changed:
+            self._rebuild(embedding)
+        else:
+            self._update(embedding, changes)
+        self._used_timeslots = embedding.used_timeslots
+        return self._assemble(embedding)
+
+    def _rebuild(self, embedding: PartialEmbedding):
+        embedding.track_changes()
+        self._embedding = embedding
+
+        shared = SharedValues(embedding)
+
+        num_enodes = len(embedding.enode_table())
+        self._node_rows = np.zeros((num_enodes, self._node_dim))
+        self._enode_node = np.zeros(num_enodes, dtype=int)
+        self._compute_nodes(
+            shared, embedding.enode_indices(), self._node_columns
+        )
+
+        num_edges = len(embedding.edge_chosen_array())
+        self._edge_rows = np.zeros((num_edges, self._edge_dim))
+        self._edge_ends = np.array(
+            embedding.edge_endpoints(np.arange(num_edges)), dtype=int
+        ).reshape(3, num_edges)
+        self._compute_edges(
+            shared, embedding.live_edge_indices(), self._edge_columns
+        )
+
+        (sources, targets) = embedding.open_edge_arrays()
+        self._open_slot = {
+            (source, target): slot
+            for (slot, (source, target)) in enumerate(
+                zip(sources.tolist(), targets.tolist())
+            )
+        }
+        self._open_rows = np.zeros((len(sources), self._edge_dim))
+        self._open_ends = np.array([sources, targets], dtype=int).reshape(
+            2, len(sources)
+        )
+        self._open_alive = np.ones(len(sources), dtype=bool)
+        self._compute_open(
+            shared, np.arange(len(sources)), self._edge_columns
+        )
+
+    def _compute_nodes(self, shared, idx, columns):
+        """Recomputes some node features for enodes by index"""
+        if len(idx) == 0:
+            return
+        embedding = shared.embedding
+        enodes = embedding.enode_table()
+        index = embedding.infra.node_index()
+        self._enode_node[idx] = [index[enodes[i].node] for i in idx]
+        for (feature, start, end) in columns:
+            self._node_rows[idx, start:end] = feature.process_nodes(
+                embedding, idx, shared
+            )
+
+    def _compute_edges(self, shared, edges, columns):
+        """Recomputes some edge features for edges by index"""
+        if len(edges) == 0:
+            return
+        (sources, targets, timeslots) = self._edge_ends[:, edges]
+        shared = shared.for_edges()
+        for (feature, start, end) in columns:
+            self._edge_rows[edges, start:end] = feature.process_edges(
+                shared.embedding, sources, targets, timeslots, shared
+            )
+
+    def _compute_open(self, shared, slots, columns):
+        """Recomputes some edge features for edges of the open timeslot
+        by slot"""
+        if len(slots) == 0:
+            return
+        (sources, targets) = self._open_ends[:, slots]
+        timeslots = np.full(len(slots), shared.embedding.used_timeslots)
+        shared = shared.for_edges()
+        for (feature, start, end) in columns:
+            self._open_rows[slots, start:end] = feature.process_edges(
+                shared.embedding, sources, targets, timeslots, shared
+            )
+
+    def _update(self, embedding, changes):
+        shared = SharedValues(embedding)
+        self._update_nodes(shared, changes)
+        self._update_edges(shared, changes)
+        self._update_open(shared, changes)
+
+    def _update_nodes(self, shared, changes):
+        """Recomputes the outdated features of enodes"""
+        embedding = shared.embedding
+        num_enodes = len(embedding.enode_table())
+        self._node_rows = _resized(self._node_rows, num_enodes)
+        self._enode_node = _resized(self._enode_node, num_enodes)
+        alive = np.zeros(num_enodes, dtype=bool)
+        alive[embedding.enode_indices()] = True
+        new = self._mask(
+            num_enodes, changes.enodes_added | changes.enodes_removed
+        )
+        new &= alive
+        self._compute_nodes(shared, np.flatnonzero(new), self._node_columns)
+        chosen = self._mask(num_enodes, changes.enodes_chosen)
+        index = embedding.infra.node_index()
+        capacity_changed = np.isin(
+            self._enode_node,
+            [index[node] for node in changes.capacity_changed],
+        )
+        for column in self._node_columns:
+            deps = column[0].depends_on
+            if deps is None or (
+                "embedded_blocks" in deps and changes.blocks_embedded
+            ):
+                outdated = alive.copy()
+            else:
+                outdated = np.zeros(num_enodes, dtype=bool)
+                if "chosen" in deps:
+                    outdated |= chosen
+                if "capacity" in deps:
+                    outdated |= capacity_changed
+            outdated &= alive & ~new
+            self._compute_nodes(shared, np.flatnonzero(outdated), [column])
+
+    def _update_edges(self, shared, changes):
+        """Recomputes the outdated features of edges outside of the open
+        timeslot"""
+        embedding = shared.embedding
+        num_edges = len(embedding.edge_chosen_array())
+        self._edge_rows = _resized(self._edge_rows, num_edges)
+        self._edge_ends = _resized(self._edge_ends.T, num_edges).T
+        alive = np.zeros(num_edges, dtype=bool)
+        alive[embedding.live_edge_indices()] = True
+        new = self._mask(
+            num_edges, changes.edges_added | changes.edges_removed
+        )
+        new &= alive
+        self._edge_ends[:, new] = embedding.edge_endpoints(np.flatnonzero(new))
+        self._compute_edges(shared, np.flatnonzero(new), self._edge_columns)
+        chosen = self._mask(num_edges, changes.edges_chosen)
+        timeslots = self._edge_ends[2]
+        senders_changed = np.isin(timeslots, list(changes.senders_changed))
+        timeslot_changed = np.zeros(num_edges, dtype=bool)
+        if embedding.used_timeslots != self._used_timeslots:
+            timeslot_changed = timeslots >= min(
+                embedding.used_timeslots, self._used_timeslots
+            )
+        for column in self._edge_columns:
+            deps = column[0].depends_on
+            if deps is None:
+                outdated = alive.copy()
+            else:
+                outdated = np.zeros(num_edges, dtype=bool)
+                if "chosen" in deps:
+                    outdated |= chosen
+                if "senders" in deps:
+                    outdated |= senders_changed
+                if "timeslot" in deps:
+                    outdated |= timeslot_changed
+            outdated &= alive & ~new
+            self._compute_edges(shared, np.flatnonzero(outdated), [column])
+
+    def _update_open(self, shared, changes):
+        """Recomputes the outdated features of edges in the open
+        timeslot"""
+        embedding = shared.embedding
+        new_slots = self._update_open_slots(
+            embedding, changes.open_edges_added | changes.open_edges_removed
+        )
+        self._compute_open(shared, new_slots, self._edge_columns)
+        alive = self._open_alive.copy()
+        alive[new_slots] = False
+        timeslot_changed = embedding.used_timeslots != self._used_timeslots
+        senders_changed = embedding.used_timeslots in changes.senders_changed
+        for column in self._edge_columns:
+            deps = column[0].depends_on
+            if (
+                deps is None
+                or ("timeslot" in deps and timeslot_changed)
+                or ("senders" in deps and senders_changed)
+            ):
+                self._compute_open(shared, np.flatnonzero(alive), [column])
+
+    @staticmethod
+    def _mask(length, indices):
+        """Boolean mask of the indices that are below a length"""
+        mask = np.zeros(length, dtype=bool)
+        mask[[i for i in indices if i < length]] = True
+        return mask
+
+    def _update_open_slots(self, embedding, pairs):
+        """Updates the slots of the open timeslot edges that may have
+        changed and returns the slots whose features are outdated"""
+        outdated = []
+        free = list(np.flatnonzero(~self._open_alive))
+        for pair in pairs:
+            exists = embedding.is_open_edge(*pair)
+            slot = self._open_slot.get(pair)
+            if slot is not None and not exists:
+                del self._open_slot[pair]
+                self._open_alive[slot] = False
+                free.append(slot)
+            elif exists:
+                if slot is None:
+                    slot = free.pop() if free else self._add_open_slot()
+                    self._open_slot[pair] = slot
+                    self._open_alive[slot] = True
+                    self._open_ends[:, slot] = pair
+                # the pair may connect other enodes than before
+                outdated.append(slot)
+        return np.array(outdated, dtype=int)
+
+    def _add_open_slot(self):
+        slot = len(self._open_alive)
+        self._open_rows = _resized(self._open_rows, slot + 1)
+        self._open_ends = _resized(self._open_ends.T, slot + 1).T
+        self._open_alive = _resized(self._open_alive, slot + 1)
+        return slot
+
+    def _assemble(self, embedding):
+        idx = embedding.enode_indices()
+        enodes = embedding.enode_table()
+        # enode index -> position in the node array
+        position = np.zeros(len(enodes), dtype=np.int32)
+        position[idx] = np.arange(len(idx), dtype=np.int32)
+
+        live = embedding.live_edge_indices()
+        slots = np.flatnonzero(self._open_alive)
+        sources = np.concatenate(
+            [self._edge_ends[0, live], self._open_ends[0, slots]]
+        )
+        targets = np.concatenate(
+            [self._edge_ends[1, live], self._open_ends[1, slots]]
+        )
+        timeslots = np.concatenate(
+            [
+                self._edge_ends[2, live],
+                np.full(len(slots), embedding.used_timeslots, dtype=int),
+            ]
+        )
+        chosen = np.concatenate(
+            [
+                embedding.edge_chosen_array()[live],
+                np.zeros(len(slots), dtype=bool),
+            ]
+        )
+        possible = ~chosen & embedding.enode_chosen_array()[sources]
+
+        edges = np.zeros((len(sources), 2 + self._edge_dim))
+        edges[:, POSSIBLE_IDX] = possible
+        edges[:, TIMESLOT_IDX] = timeslots
+        edges[:, 2:] = np.concatenate(
+            [self._edge_rows[live], self._open_rows[slots]]
+        )
+        arrays = {
+            "nodes": self._node_rows[idx],
+            "edges": edges,
+            "senders": position[sources],
+            "receivers": position[targets],
+            # no globals in input
+            "globals": np.zeros((1, 1)),
+            "n_node": np.array([len(idx)], dtype=np.int32),
+            "n_edge": np.array([len(sources)], dtype=np.int32),
+        }
+        actions = _ActionList(
+            enodes, sources[possible], targets[possible], timeslots[possible]
+        )
+        return (arrays, actions)
@@ -11,15 +11,15 @@ from hyperparameters import GENERATOR_DEFAULTS
 
 def _play_episode(emb):
     emb = emb.reset()
-    enodes = [len(emb.graph.nodes())]
-    edges = [len(emb.graph.edges(keys=True))]
-    choices = [len(emb.possibilities())]
-    while len(emb.possibilities()) > 0:
+    enodes = [len(emb.nodes())]
+    edges = [len(emb.edges())]
+    choices = [emb.num_possibilities()]
+    while emb.num_possibilities() > 0:
         action = baseline_agent.act(emb, randomness=0, rand=np.random)
         emb.take_action(*action)
-        enodes.append(len(emb.graph.nodes()))
-        edges.append(len(emb.graph.edges(keys=True)))
-        choices.append(len(emb.possibilities()))
+        enodes.append(len(emb.nodes()))
+        edges.append(len(emb.edges()))
+        choices.append(emb.num_possibilities())
     return (enodes, edges, choices)
 
 
@@ -4,6 +4,8 @@ Some helper function for dealing with wireless signal transmission.
 
 from math import inf, log, sqrt
 
+import numpy as np
+
 
 def subtract_dbm(dbm1: float, dbm2: float):
     """Adds two decibel values"""
@@ -150,3 +152,69 @@ def sinr(
     # to subtract (not divide) since we are calculating in dBm, which is a
     # logarithmic scale.
     return received_signal_dbm - received_noise_dbm
+
+
+def shannon_capacity(bandwidth: float, sinr_db: float):
+    """
+    Upper bound on the datarate of a channel with the given bandwidth
+    and SINR (in decibels), following the Shannon-Hartley theorem.
+    """
+    return bandwidth * log(1 + 10 ** (sinr_db / 10), 2)
+
+
+# Array variants of the functions above. They accept numpy arrays (or
+# anything that can be broadcast to one) and follow the same conventions
+# regarding infinities and zero.
+
+
+def dbm_to_watt_array(dbm):
+    """Array variant of `dbm_to_watt`"""
+    # -inf results in 0 without any special handling
+    return 10.0 ** (np.asarray(dbm, dtype=float) / 10.0) / 1000.0
+
+
+def watt_to_dbm_array(watts):
+    """Array variant of `watt_to_dbm`"""
+    watts = np.asarray(watts, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        decibel = np.log(watts * 1000.0) / np.log(10.0) * 10.0
+    return np.where(watts <= 0, -inf, decibel)
+
+
+def log_path_loss_array(
+    distance_meters, loss_exponent: int = 2, system_loss: float = 0
+):
+    """Array variant of `log_path_loss`"""
+    distance_meters = np.asarray(distance_meters, dtype=float)
+    # log(0) = -inf, just like in the scalar version
+    with np.errstate(divide="ignore"):
+        distance_decibel = 10 * (np.log(distance_meters) / np.log(10))
+    return loss_exponent * distance_decibel + system_loss
+
+
+def distance_array(x1, y1, x2, y2):
+    """Array variant of `distance`"""
+    return np.sqrt((np.subtract(x1, x2)) ** 2 + (np.subtract(y1, y2)) ** 2)
+
+
+def power_received_array(distance_meter, transmit_power_dbm):
+    """Array variant of `power_received`"""
+    path_loss = log_path_loss_array(distance_meter)
+    return np.asarray(transmit_power_dbm, dtype=float) - path_loss
+
+
+def sinr_array(
+    received_signal_dbm, received_interference_dbm, noise_floor_dbm
+):
+    """Array variant of `sinr`"""
+    received_noise_watt = dbm_to_watt_array(
+        received_interference_dbm
+    ) + dbm_to_watt_array(noise_floor_dbm)
+    received_noise_dbm = watt_to_dbm_array(received_noise_watt)
+    return np.asarray(received_signal_dbm, dtype=float) - received_noise_dbm
+
+
+def shannon_capacity_array(bandwidth, sinr_db):
+    """Array variant of `shannon_capacity`"""
+    sinr_db = np.asarray(sinr_db, dtype=float)
+    return bandwidth * (np.log(1 + 10 ** (sinr_db / 10)) / np.log(2))
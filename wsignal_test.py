@@ -1,6 +1,9 @@
 """Test wireless signal utility functions"""
 
+from math import inf
+import numpy as np
 from pytest import approx
+import wsignal
 from wsignal import dbm_to_watt, watt_to_dbm
 
 
@@ -33,3 +36,52 @@ def test_db_watt_conversion_reversible():
     """
     db = 10
     assert watt_to_dbm(dbm_to_watt(db)) == approx(db)
+
+
+def test_array_variants_match_scalar_versions():
+    """
+    Tests that the array variants agree with the scalar functions,
+    including the special handling of zero and infinity.
+    """
+    dbm = [-inf, -30.0, 0.0, 12.5, 30.0]
+    assert list(wsignal.dbm_to_watt_array(dbm)) == approx(
+        [dbm_to_watt(x) for x in dbm]
+    )
+
+    watts = [-1.0, 0.0, 1e-6, 1.0, 42.0]
+    assert list(wsignal.watt_to_dbm_array(watts)) == approx(
+        [watt_to_dbm(x) for x in watts]
+    )
+
+    distances = [0.0, 0.5, 1.0, 10.0, 1234.5]
+    assert list(wsignal.log_path_loss_array(distances, 3, 1)) == approx(
+        [wsignal.log_path_loss(d, 3, 1) for d in distances]
+    )
+    assert list(wsignal.power_received_array(distances, 20)) == approx(
+        [wsignal.power_received(d, 20) for d in distances]
+    )
+
+    (x1, y1, x2, y2) = ([0, 1, -3], [0, 2, 4], [0, 4, 0], [1, 6, 0])
+    assert list(wsignal.distance_array(x1, y1, x2, y2)) == approx(
+        [wsignal.distance(*args) for args in zip(x1, y1, x2, y2)]
+    )
+
+    signal = [inf, -inf, 10.0, 20.0]
+    interference = [-inf, 0.0, -inf, 15.0]
+    assert list(wsignal.sinr_array(signal, interference, -30)) == approx(
+        [wsignal.sinr(s, i, -30) for (s, i) in zip(signal, interference)]
+    )
+
+    sinrs = [-inf, -10.0, 0.0, 25.0, inf]
+    assert list(wsignal.shannon_capacity_array(2, sinrs)) == approx(
+        [wsignal.shannon_capacity(2, s) for s in sinrs]
+    )
+
+
+def test_array_variants_broadcast():
+    """Tests that the array variants work on whole matrices"""
+    dbm = np.array([[0.0, -inf], [10.0, 20.0]])
+    watts = wsignal.dbm_to_watt_array(dbm)
+    assert watts.shape == (2, 2)
+    assert watts[0, 1] == 0
+    assert wsignal.watt_to_dbm_array(watts) == approx(dbm)